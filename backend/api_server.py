@@ -35,12 +35,17 @@ load_dotenv(dotenv_path=Path(__file__).resolve().parent.parent / ".env.local")
 
 from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse, RedirectResponse, StreamingResponse
+from fastapi.responses import FileResponse, JSONResponse, RedirectResponse, StreamingResponse, Response
 from pydantic import BaseModel
 from PIL import Image as PILImage
 import hashlib
 
-from check_extractor import CheckExtractorApp
+from check_extractor import (CheckCrop, CheckExtractorApp, CROP_IMAGE_MIMES, CROP_PROFILES, DETECT_METHODS,
+                             find_crop_image, image_mime, pdf_preflight, preflight_problems,
+                             tmpfs_output_dir)
+from page_cache import PageCache
+from layout_store import LayoutStore
+from crop_index import CropIndex
 
 # ── Supabase REST (lightweight – no heavy SDK needed) ─────────────
 import requests as _requests
@@ -346,6 +351,26 @@ def _supabase_rpc(fn_name: str, params: dict = None):
         return None
 
 
+def _crop_image_file(job: dict, check_id: str) -> str:
+    """Crop file name of a check: the image_file it was saved under (kept in
+    checks_data), else derived from the job's crop profile."""
+    for c in (job or {}).get("checks", []):
+        if c.get("check_id") == check_id and c.get("image_file"):
+            return c["image_file"]
+    return f"{check_id}{CROP_PROFILES[(job or {}).get('crop_profile') or 'png']['ext']}"
+
+
+def _crop_profile_of(checks: list):
+    """Crop profile implied by the checks' saved image files (None if unknown)."""
+    ext = next((os.path.splitext(c["image_file"])[1] for c in checks if c.get("image_file")), None)
+    return next((name for name, p in CROP_PROFILES.items() if p["ext"] == ext), None)
+
+
+def _crop_bytes_of(checks: list) -> int:
+    """Total encoded size of the checks' crops (their saved image_bytes)."""
+    return sum(c.get("image_bytes") or 0 for c in checks)
+
+
 def _load_jobs_from_supabase():
     """Load existing jobs from Supabase into in-memory store on startup."""
     if not _supabase_ok:
@@ -382,6 +407,9 @@ def _load_jobs_from_supabase():
                 "engine_results": cd.get("engine_results", {}),  # Raw fields per engine
                 "engine_extractions": cd.get("engine_extractions", {}),  # Full extraction per engine
                 "engine_times_ms": cd.get("engine_times_ms", {}),
+                "deduplicated": cd.get("deduplicated"),
+                "image_file": cd.get("image_file"),
+                "image_bytes": cd.get("image_bytes"),
             })
         jobs[jid] = {
             "job_id": jid,
@@ -393,6 +421,10 @@ def _load_jobs_from_supabase():
             "total_pages": row.get("total_pages", 0),
             "total_checks": row.get("total_checks", 0),
             "checks": checks,
+            "crop_profile": _crop_profile_of(checks),
+            "crop_bytes": _crop_bytes_of(checks),
+            "skipped_crops": row.get("skipped_crops") or 0,
+            "skipped_by_step": row.get("skipped_by_step") or {},
             "error": row.get("error_message"),
             "created_at": row.get("created_at", ""),
             "completed_at": row.get("completed_at"),
@@ -478,6 +510,8 @@ def _load_engine_results(results_dir: str, check: dict):
         check["extraction"] = hybrid.get("extraction", {})
         check["methods_used"] = hybrid.get("methods_used", [])
         check["engine_times_ms"] = hybrid.get("engine_times_ms", {})
+        # Set when the result was reused from an identical crop (no engines ran)
+        check["deduplicated"] = hybrid.get("deduplicated")
     
     # Load individual engine results (raw fields only)
     engine_results = {}
@@ -601,13 +635,62 @@ jobs: dict = {}
 _SCRIPT_DIR = Path(__file__).resolve().parent
 UPLOAD_DIR = _SCRIPT_DIR / "uploads"
 OUTPUT_DIR = _SCRIPT_DIR / "output"
+# OUTPUT_TMPFS keeps job folders (crops, OCR results, page previews) in RAM.
+# They do not survive a restart; images are then served from Supabase Storage.
+if os.environ.get("OUTPUT_TMPFS", "").lower() in ("true", "1", "yes"):
+    OUTPUT_DIR = Path(tmpfs_output_dir("check-extractor-output") or OUTPUT_DIR)
 UPLOAD_DIR.mkdir(exist_ok=True)
 OUTPUT_DIR.mkdir(exist_ok=True)
 
+# Rendered-page cache: re-extraction, re-detection and page previews read
+# rasterized pages from here instead of re-running Poppler (0 MB disables).
+_page_cache_mb = int(os.environ.get("PAGE_CACHE_MAX_MB", "") or 2048)
+_page_cache = PageCache(
+    os.environ.get("PAGE_CACHE_DIR", "").strip() or str(_SCRIPT_DIR / "page_cache"),
+    max_bytes=_page_cache_mb * 1024 * 1024,
+) if _page_cache_mb > 0 else None
+
+# Layout fingerprint store: documents matching a statement template seen in
+# an earlier job skip format voting and start with its grids (0 disables).
+_layout_store_max = int(os.environ.get("LAYOUT_STORE_MAX_ENTRIES", "") or 500)
+_layout_store = LayoutStore(
+    os.environ.get("LAYOUT_STORE_DIR", "").strip() or str(_SCRIPT_DIR / "layout_store"),
+    max_entries=_layout_store_max,
+) if _layout_store_max > 0 else None
+
+# Crop index: a cheque already OCR'd in any job (same pixels; or, if
+# CROP_DEDUPE_DISTANCE > 0, a dHash within that many bits and the same
+# text-layer check number) reuses that extraction (0 entries disables).
+_crop_index_max = int(os.environ.get("CROP_INDEX_MAX_ENTRIES", "") or 20000)
+_crop_index = CropIndex(
+    os.environ.get("CROP_INDEX_DIR", "").strip() or str(_SCRIPT_DIR / "crop_index"),
+    max_entries=_crop_index_max,
+    max_distance=int(os.environ.get("CROP_DEDUPE_DISTANCE", "") or 0),
+) if _crop_index_max > 0 else None
+
 # Load persisted jobs from Supabase on startup
 _load_jobs_from_supabase()
 
 
+def _preflight_upload(pdf_path: str) -> dict:
+    """Read page count/sizes/makeup from PDF metadata and reject pathological
+    files before any rendering. Removes the upload on rejection."""
+    try:
+        info = pdf_preflight(pdf_path)
+        problems = preflight_problems(info)
+    except Exception as e:
+        info, problems = None, [f"unreadable PDF ({e})"]
+    if problems:
+        try:
+            os.remove(pdf_path)
+        except OSError:
+            pass
+        raise HTTPException(422, f"PDF rejected: {'; '.join(problems)}")
+    print(f"  Preflight: {info['page_count']} pages ({info['scan_pages']} scanned, "
+          f"{info['vector_pages']} vector, {info['mixed_pages']} mixed) in {info['elapsed_ms']} ms")
+    return info
+
+
 def _process_pdf(job_id: str, pdf_path: str, pdf_name: str):
     """Background worker: detect checks, extract images, run OCR, save to Supabase."""
     try:
@@ -620,13 +703,19 @@ def _process_pdf(job_id: str, pdf_path: str, pdf_name: str):
         
         out_dir = str(OUTPUT_DIR / job_id)
 
-        app_ext = CheckExtractorApp(pdf_path, output_dir=out_dir)
+        app_ext = CheckExtractorApp(pdf_path, output_dir=out_dir, page_cache=_page_cache,
+                                    preflight=jobs[job_id].get("preflight"),
+                                    detect_method=jobs[job_id].get("detect_method"),
+                                    layout_store=_layout_store, crop_index=_crop_index,
+                                    crop_profile=jobs[job_id].get("crop_profile"))
+        jobs[job_id]["page_cache_key"] = app_ext.page_cache_key
+        jobs[job_id]["known_template"] = app_ext.known_template
         jobs[job_id]["doc_format"] = (
             "Contour/Bordered" if app_ext.doc_format == "A"
             else "Line-Grid" if app_ext.doc_format == "B"
             else "Auto"
         )
-        jobs[job_id]["total_pages"] = len(app_ext.pages)
+        jobs[job_id]["total_pages"] = app_ext.page_count
 
         # ── Phase 1: Extract images ──────────────────────────────
         jobs[job_id]["status"] = "extracting"
@@ -639,22 +728,17 @@ def _process_pdf(job_id: str, pdf_path: str, pdf_name: str):
         })
         
         manifest = app_ext.extract_all_images()
+        app_ext.flush_crops()  # the check list and uploads below read the files
         jobs[job_id]["total_checks"] = len(manifest)
+        # Crops the pre-OCR gate kept out of OCR (one saved API call each)
+        jobs[job_id]["skipped_crops"] = app_ext.gate.total
+        jobs[job_id]["skipped_by_step"] = dict(app_ext.gate.skipped)
 
-        # Build check list
-        checks = []
-        for cid, img_path, page_num in manifest:
-            im = PILImage.open(img_path)
-            checks.append({
-                "check_id": cid,
-                "page": page_num,
-                "image_file": os.path.basename(img_path),
-                "image_path": img_path,
-                "width": im.size[0],
-                "height": im.size[1],
-                "extraction": None,
-            })
+        # Build check list (CheckCrop fields; sizes are known without reopening crops)
+        checks = [dict(crop.to_json(), extraction=None) for crop in manifest]
         jobs[job_id]["checks"] = checks
+        jobs[job_id]["crop_profile"] = app_ext.crop_profile
+        jobs[job_id]["crop_bytes"] = _crop_bytes_of(checks)
 
         # ── Create Supabase DB row (one row per PDF job) ─────────
         db_row = _supabase_insert("check_jobs", {
@@ -664,6 +748,8 @@ def _process_pdf(job_id: str, pdf_path: str, pdf_name: str):
             "doc_format": jobs[job_id]["doc_format"],
             "total_pages": jobs[job_id]["total_pages"],
             "total_checks": len(checks),
+            "skipped_crops": jobs[job_id]["skipped_crops"],
+            "skipped_by_step": jobs[job_id]["skipped_by_step"],
             "checks_data": json.dumps([]),
         })
 
@@ -689,9 +775,9 @@ def _process_pdf(job_id: str, pdf_path: str, pdf_name: str):
                 with open(img_p, "rb") as f:
                     url = _supabase_upload_file(
                         "checks",
-                        f"jobs/{job_id}/images/{check['check_id']}.png",
+                        f"jobs/{job_id}/images/{check['image_file']}",
                         f.read(),
-                        "image/png",
+                        image_mime(img_p),
                     )
                 if url:
                     check["storage_url"] = url
@@ -787,6 +873,9 @@ def _process_pdf(job_id: str, pdf_path: str, pdf_name: str):
                 "engine_results": c.get("engine_results", {}),  # Raw fields per engine
                 "engine_extractions": c.get("engine_extractions", {}),  # Full extraction per engine
                 "engine_times_ms": c.get("engine_times_ms", {}),
+                "deduplicated": c.get("deduplicated"),
+                "image_file": c.get("image_file"),
+                "image_bytes": c.get("image_bytes"),
             }
             checks_data.append(check_data)
             print(f"  Saving {c['check_id']}: image_url={check_data['image_url'][:60]}..., methods={check_data['methods_used']}, has_extraction={bool(check_data['extraction'])}, engines={list(check_data.get('engine_extractions', {}).keys())}")
@@ -844,10 +933,17 @@ def health():
 
 
 @app.post("/api/upload-pdf")
-async def upload_pdf(file: UploadFile = File(...), _auth=Depends(_verify_token)):
-    """Upload a PDF file, start detection + extraction in background."""
+async def upload_pdf(file: UploadFile = File(...), detect_method: Optional[str] = None,
+                     crop_profile: Optional[str] = None, _auth=Depends(_verify_token)):
+    """Upload a PDF file, start detection + extraction in background.
+    detect_method: optional per-document detector ("contours" or "components").
+    crop_profile: optional crop encoding (see CROP_PROFILES, e.g. "webp")."""
     if not file or not file.filename:
         raise HTTPException(400, "No file provided")
+    if detect_method and detect_method not in DETECT_METHODS:
+        raise HTTPException(400, f"detect_method must be one of {', '.join(DETECT_METHODS)}")
+    if crop_profile and crop_profile not in CROP_PROFILES:
+        raise HTTPException(400, f"crop_profile must be one of {', '.join(CROP_PROFILES)}")
 
     if "." not in file.filename:
         raise HTTPException(400, "Invalid file name")
@@ -883,6 +979,8 @@ async def upload_pdf(file: UploadFile = File(...), _auth=Depends(_verify_token))
     with open(pdf_path, "wb") as f:
         f.write(content)
 
+    preflight = _preflight_upload(pdf_path)
+
     jobs[job_id] = {
         "job_id": job_id,
         "status": "pending",
@@ -890,8 +988,11 @@ async def upload_pdf(file: UploadFile = File(...), _auth=Depends(_verify_token))
         "pdf_path": pdf_path,
         "file_size": file_size,
         "file_hash": file_hash,
+        "preflight": preflight,
+        "detect_method": detect_method,
+        "crop_profile": crop_profile,
         "doc_format": None,
-        "total_pages": 0,
+        "total_pages": preflight["page_count"],
         "total_checks": 0,
         "checks": [],
         "pages": [],
@@ -905,7 +1006,7 @@ async def upload_pdf(file: UploadFile = File(...), _auth=Depends(_verify_token))
         "status": "pending",
         "pdf_name": file.filename,
         "file_size": file_size,
-        "total_pages": 0,
+        "total_pages": preflight["page_count"],
         "total_checks": 0,
         "created_at": jobs[job_id]["created_at"],
     })
@@ -914,14 +1015,22 @@ async def upload_pdf(file: UploadFile = File(...), _auth=Depends(_verify_token))
     thread.daemon = True
     thread.start()
 
-    return {"job_id": job_id, "status": "pending", "message": "Processing started"}
+    return {"job_id": job_id, "status": "pending", "message": "Processing started",
+            "total_pages": preflight["page_count"]}
 
 
 @app.post("/api/upload-analyze")
-async def upload_analyze(file: UploadFile = File(...), _auth=Depends(_verify_token)):
-    """Upload a PDF, detect cheques, return page info with dimensions — no OCR yet."""
+async def upload_analyze(file: UploadFile = File(...), detect_method: Optional[str] = None,
+                         crop_profile: Optional[str] = None, _auth=Depends(_verify_token)):
+    """Upload a PDF, detect cheques, return page info with dimensions — no OCR yet.
+    detect_method: optional per-document detector ("contours" or "components").
+    crop_profile: optional crop encoding (see CROP_PROFILES, e.g. "webp")."""
     if not file or not file.filename:
         raise HTTPException(400, "No file provided")
+    if detect_method and detect_method not in DETECT_METHODS:
+        raise HTTPException(400, f"detect_method must be one of {', '.join(DETECT_METHODS)}")
+    if crop_profile and crop_profile not in CROP_PROFILES:
+        raise HTTPException(400, f"crop_profile must be one of {', '.join(CROP_PROFILES)}")
 
     if "." not in file.filename:
         raise HTTPException(400, "Invalid file name")
@@ -960,10 +1069,15 @@ async def upload_analyze(file: UploadFile = File(...), _auth=Depends(_verify_tok
     with open(pdf_path, "wb") as f:
         f.write(content)
 
+    preflight = _preflight_upload(pdf_path)
+
     # Synchronously analyze the PDF: load pages, detect cheques
     try:
         out_dir = str(OUTPUT_DIR / job_id)
-        app_ext = CheckExtractorApp(pdf_path, output_dir=out_dir)
+        app_ext = CheckExtractorApp(pdf_path, output_dir=out_dir, page_cache=_page_cache,
+                                    preflight=preflight, detect_method=detect_method,
+                                    layout_store=_layout_store, crop_index=_crop_index,
+                                    crop_profile=crop_profile)
 
         doc_format = (
             "Contour/Bordered" if app_ext.doc_format == "A"
@@ -971,42 +1085,41 @@ async def upload_analyze(file: UploadFile = File(...), _auth=Depends(_verify_tok
             else "Auto"
         )
 
+        # Save page images for preview as each page is rasterized, and
+        # extract check images now so they're ready for preview
+        pages_dir = os.path.join(out_dir, "pages")
+        os.makedirs(pages_dir, exist_ok=True)
+
+        def _save_page_preview(idx, page_img):
+            page_img.to_image().save(os.path.join(pages_dir, f"page_{idx+1}.png"))
+
+        manifest = app_ext.extract_all_images(on_page=_save_page_preview)
+        app_ext.flush_crops()  # the check list and uploads below read the files
+
         # Build page info with dimensions and check counts
         pages_info = []
         total_checks = 0
-        for idx, page_img in enumerate(app_ext.pages):
+        for idx in range(app_ext.page_count):
             boxes = app_ext.page_boxes.get(idx, [])
             checks_on_page = len(boxes) if boxes else 0
             total_checks += checks_on_page
+            width, height = app_ext.page_sizes.get(idx, (0, 0))
             pages_info.append({
                 "page_number": idx + 1,
-                "width": page_img.width,
-                "height": page_img.height,
+                "width": width,
+                "height": height,
                 "checks_on_page": checks_on_page,
             })
 
-        # Save page images for preview
-        pages_dir = os.path.join(out_dir, "pages")
-        os.makedirs(pages_dir, exist_ok=True)
-        for idx, page_img in enumerate(app_ext.pages):
-            page_img.save(os.path.join(pages_dir, f"page_{idx+1}.png"))
+        # Printed fields from the PDF text layer, kept for the extraction step
+        text_layer = app_ext.extract_text_layer(manifest) if app_ext.text_layer else {}
 
-        # Also extract check images now so they're ready for preview
-        manifest = app_ext.extract_all_images()
+        # Build check list (CheckCrop fields; sizes are known without reopening crops)
+        checks = [dict(crop.to_json(), extraction=None, text_layer=text_layer.get(crop.check_id))
+                  for crop in manifest]
 
-        # Build check list
-        checks = []
-        for cid, img_path, page_num in manifest:
-            im = PILImage.open(img_path)
-            checks.append({
-                "check_id": cid,
-                "page": page_num,
-                "image_file": os.path.basename(img_path),
-                "image_path": img_path,
-                "width": im.size[0],
-                "height": im.size[1],
-                "extraction": None,
-            })
+        # The app waits in jobs until extraction; don't hold its crop pixels meanwhile
+        app_ext.release_crops()
 
         # Store in memory
         jobs[job_id] = {
@@ -1017,13 +1130,21 @@ async def upload_analyze(file: UploadFile = File(...), _auth=Depends(_verify_tok
             "file_size": file_size,
             "file_hash": file_hash,
             "doc_format": doc_format,
-            "total_pages": len(app_ext.pages),
+            "total_pages": app_ext.page_count,
             "total_checks": len(manifest),
             "checks": checks,
             "pages": pages_info,
             "error": None,
             "created_at": datetime.now().isoformat(),
             "completed_at": None,
+            "page_cache_key": app_ext.page_cache_key,
+            "preflight": preflight,
+            "detect_method": app_ext.detect_method,
+            "known_template": app_ext.known_template,
+            "crop_profile": app_ext.crop_profile,
+            "crop_bytes": _crop_bytes_of(checks),
+            "skipped_crops": app_ext.gate.total,
+            "skipped_by_step": dict(app_ext.gate.skipped),
             "_app_ext": app_ext,
             "_manifest": manifest,
         }
@@ -1034,9 +1155,11 @@ async def upload_analyze(file: UploadFile = File(...), _auth=Depends(_verify_tok
             "pdf_name": file.filename,
             "status": "analyzed",
             "doc_format": doc_format,
-            "total_pages": len(app_ext.pages),
+            "total_pages": app_ext.page_count,
             "total_checks": len(manifest),
             "file_size": file_size,
+            "skipped_crops": app_ext.gate.total,
+            "skipped_by_step": dict(app_ext.gate.skipped),
             "checks_data": json.dumps([]),
         })
 
@@ -1055,9 +1178,9 @@ async def upload_analyze(file: UploadFile = File(...), _auth=Depends(_verify_tok
                 with open(check["image_path"], "rb") as f:
                     url = _supabase_upload_file(
                         "checks",
-                        f"jobs/{job_id}/images/{check['check_id']}.png",
+                        f"jobs/{job_id}/images/{check['image_file']}",
                         f.read(),
-                        "image/png",
+                        image_mime(check["image_path"]),
                     )
                 if url:
                     check["storage_url"] = url
@@ -1083,8 +1206,10 @@ async def upload_analyze(file: UploadFile = File(...), _auth=Depends(_verify_tok
             "pdf_name": file.filename,
             "file_size": file_size,
             "doc_format": doc_format,
-            "total_pages": len(app_ext.pages),
+            "total_pages": app_ext.page_count,
             "total_checks": len(manifest),
+            "skipped_crops": app_ext.gate.total,
+            "skipped_by_step": dict(app_ext.gate.skipped),
             "pages": pages_info,
             "checks": checks_response,
         }
@@ -1094,6 +1219,36 @@ async def upload_analyze(file: UploadFile = File(...), _auth=Depends(_verify_tok
         raise HTTPException(500, f"Analysis failed: {str(e)}")
 
 
+_DOC_FORMAT_CODES = {"Contour/Bordered": "A", "Line-Grid": "B"}
+
+
+def _check_number(check_id: str) -> int:
+    """1-based document-wide number of a check_XXXX id."""
+    return int(check_id.rsplit("_", 1)[-1])
+
+
+def _extraction_page_span(req, checks):
+    """Pages to rasterize when re-extracting from the PDF, and the number of
+    the first check on them (from the analyzed check list, so IDs stay
+    stable). (None, None) means the whole document."""
+    if req.cheque_range and checks:
+        c_from = max(1, req.cheque_range.get("from", 1))
+        c_to = req.cheque_range.get("to", len(checks))
+        pages = [c["page"] for c in checks if c_from <= _check_number(c["check_id"]) <= c_to]
+        if not pages:
+            return None, None
+        first, last = min(pages), max(pages)
+    elif req.page_range:
+        first = max(1, req.page_range.get("from", 1))
+        last = req.page_range.get("to")
+    else:
+        return None, None
+    if first <= 1:
+        return (first, last), 1
+    first_check = 1 + sum(1 for c in checks if c["page"] < first) if checks else None
+    return (first, last), first_check
+
+
 class StartExtractionRequest(BaseModel):
     job_id: str
     methods: list[str] = ["gemini"]
@@ -1134,21 +1289,21 @@ def start_extraction(req: StartExtractionRequest, _auth=Depends(_verify_token)):
                 
                 # Check if we have existing check images - if so, we can re-extract without PDF
                 images_dir = Path(out_dir) / "images"
-                has_images = images_dir.exists() and any(images_dir.glob("check_*.png"))
+                has_images = images_dir.exists() and any(images_dir.glob("check_*.*"))
                 
                 if has_images:
                     # Build manifest from existing check images
                     print(f"  ✓ Using existing check images for re-extraction (PDF not needed)")
                     for check in checks:
                         cid = check["check_id"]
-                        img_path = str(images_dir / f"{cid}.png")
-                        if os.path.exists(img_path):
-                            manifest.append((cid, img_path, check["page"]))
+                        img_path = find_crop_image(images_dir, cid)
+                        if img_path:
+                            manifest.append(CheckCrop.from_json(dict(check, image_path=img_path)))
                     print(f"  ✓ Found {len(manifest)} existing check images")
                     
                     # Create a minimal CheckExtractorApp instance for OCR operations
                     # We don't need PDF, just the output directory for OCR results
-                    app_ext = CheckExtractorApp(None, output_dir=out_dir)
+                    app_ext = CheckExtractorApp(None, output_dir=out_dir, crop_index=_crop_index)
                     app_ext.pages = []  # No pages needed for re-extraction
                 
                 # If no local images, try to download from Supabase Storage
@@ -1163,20 +1318,21 @@ def start_extraction(req: StartExtractionRequest, _auth=Depends(_verify_token)):
                                     continue
                                 
                                 # Try to get image from storage
-                                storage_img_url = f"{_sb_url}/storage/v1/object/public/checks/jobs/{req.job_id}/checks/{cid}.png"
+                                image_file = _crop_image_file(job, cid)
+                                storage_img_url = f"{_sb_url}/storage/v1/object/public/checks/jobs/{req.job_id}/images/{image_file}"
                                 resp = _requests.get(storage_img_url, timeout=10)
                                 if resp.status_code == 200:
-                                    img_path = Path(out_dir) / "checks" / f"{cid}.png"
+                                    img_path = Path(out_dir) / "checks" / image_file
                                     img_path.parent.mkdir(parents=True, exist_ok=True)
                                     with open(img_path, "wb") as f:
                                         f.write(resp.content)
-                                    manifest.append((cid, str(img_path), check["page"]))
+                                    manifest.append(CheckCrop.from_json(dict(check, image_path=str(img_path))))
                                     print(f"  ✓ Downloaded check image {cid} from Storage")
                             
                             if manifest:
                                 print(f"  ✓ Downloaded {len(manifest)} check images from Storage")
                                 # Create a minimal CheckExtractorApp instance for OCR operations
-                                app_ext = CheckExtractorApp(None, output_dir=out_dir)
+                                app_ext = CheckExtractorApp(None, output_dir=out_dir, crop_index=_crop_index)
                                 app_ext.pages = []
                         except Exception as e:
                             print(f"  ✗ Failed to download check images from Storage: {e}")
@@ -1204,26 +1360,39 @@ def start_extraction(req: StartExtractionRequest, _auth=Depends(_verify_token)):
                         else:
                             raise HTTPException(404, "No check images or PDF found. Please re-upload the PDF.")
                     
-                    # Extract images from PDF
-                    app_ext = CheckExtractorApp(pdf_path, output_dir=out_dir)
+                    # Extract images from PDF, rasterizing only the requested pages
+                    page_span, first_check = _extraction_page_span(req, checks)
+                    app_ext = CheckExtractorApp(pdf_path, output_dir=out_dir, page_cache=_page_cache,
+                                                preflight=job.get("preflight"),
+                                                page_range=page_span, first_check_number=first_check,
+                                                doc_format=_DOC_FORMAT_CODES.get(job.get("doc_format")),
+                                                detect_method=job.get("detect_method"),
+                                                crop_index=_crop_index,
+                                                crop_profile=job.get("crop_profile"))
+                    job["page_cache_key"] = app_ext.page_cache_key
                     manifest = app_ext.extract_all_images()
+                    app_ext.flush_crops()
                     print(f"  ✓ Extracted {len(manifest)} check images from PDF")
 
             # ── Filter manifest by range ──────────────────────────
             filtered_manifest = list(manifest)
 
             if req.cheque_range:
-                # Cheque range: 1-indexed cheque numbers
+                # Cheque range: 1-indexed cheque numbers (the check_XXXX numbering,
+                # which a page-range extraction keeps document-wide)
                 c_from = max(1, req.cheque_range.get("from", 1))
-                c_to = min(len(manifest), req.cheque_range.get("to", len(manifest)))
-                filtered_manifest = filtered_manifest[c_from - 1 : c_to]
+                c_to = req.cheque_range.get("to", max(len(checks), len(manifest)))
+                filtered_manifest = [
+                    c for c in filtered_manifest
+                    if c_from <= _check_number(c.check_id) <= c_to
+                ]
                 print(f"  Cheque range filter: #{c_from}-#{c_to} → {len(filtered_manifest)} checks")
             elif req.page_range:
                 p_from = req.page_range.get("from", 1)
                 p_to = req.page_range.get("to", job.get("total_pages", 9999))
                 filtered_manifest = [
-                    (cid, ip, pn) for cid, ip, pn in filtered_manifest
-                    if p_from <= pn <= p_to
+                    c for c in filtered_manifest
+                    if p_from <= c.page <= p_to
                 ]
                 print(f"  Page range filter: pages {p_from}-{p_to} → {len(filtered_manifest)} checks")
 
@@ -1250,7 +1419,7 @@ def start_extraction(req: StartExtractionRequest, _auth=Depends(_verify_token)):
                 before = len(filtered_manifest)
                 keep = []
                 for item in filtered_manifest:
-                    cid = item[0]
+                    cid = item.check_id
                     c = checks_by_id.get(cid, {})
                     existing_extraction = c.get("extraction")
                     existing_methods = set(c.get("methods_used", []))
@@ -1368,7 +1537,11 @@ def start_extraction(req: StartExtractionRequest, _auth=Depends(_verify_token)):
                     if len(job["progress_logs"]) > 100:
                         job["progress_logs"] = job["progress_logs"][-100:]
 
-            app_ext.run_parallel_ocr(filtered_manifest, methods=req.methods, progress_callback=_on_progress)
+            # Text-layer fields found at analyze time (None = let the app read them itself)
+            prefill = {c["check_id"]: c["text_layer"] for c in checks if c.get("text_layer")} or None
+            app_ext.run_parallel_ocr(filtered_manifest, methods=req.methods,
+                                     progress_callback=_on_progress, prefill=prefill,
+                                     force=req.force)
             app_ext.save_summary(filtered_manifest)
 
             # Load all engine results back into checks (for ALL checks, not just filtered)
@@ -1437,6 +1610,9 @@ def start_extraction(req: StartExtractionRequest, _auth=Depends(_verify_token)):
                     "engine_results": c.get("engine_results", {}),  # Raw fields per engine
                     "engine_extractions": c.get("engine_extractions", {}),  # Full extraction per engine
                     "engine_times_ms": c.get("engine_times_ms", {}),
+                    "deduplicated": c.get("deduplicated"),
+                    "image_file": c.get("image_file"),
+                    "image_bytes": c.get("image_bytes"),
                 })
 
             _supabase_update("check_jobs", {"job_id": req.job_id}, {
@@ -1534,6 +1710,9 @@ def get_job(job_id: str, source: str = "auto"):
                     "total_pages": db_job.get("total_pages", 0),
                     "total_checks": db_job.get("total_checks", 0),
                     "checks": checks_data,
+                    "crop_bytes": _crop_bytes_of(checks_data),
+                    "skipped_crops": db_job.get("skipped_crops") or 0,
+                    "skipped_by_step": db_job.get("skipped_by_step") or {},
                     "error": db_job.get("error_message"),
                     "created_at": db_job.get("created_at", ""),
                     "completed_at": db_job.get("completed_at"),
@@ -1691,6 +1870,9 @@ def list_jobs(limit: int = 50, offset: int = 0, status: str = None, source: str
                     "total_pages": db_job.get("total_pages", 0),
                     "total_checks": db_job.get("total_checks", 0),
                     "checks": checks_data,
+                    "crop_bytes": _crop_bytes_of(checks_data),
+                    "skipped_crops": db_job.get("skipped_crops") or 0,
+                    "skipped_by_step": db_job.get("skipped_by_step") or {},
                     "error": db_job.get("error_message"),
                     "created_at": db_job.get("created_at", ""),
                     "completed_at": db_job.get("completed_at"),
@@ -1746,19 +1928,27 @@ def get_job_pdf(job_id: str):
 
 @app.get("/api/jobs/{job_id}/pages/{page_num}/image")
 def get_page_image(job_id: str, page_num: int):
-    """Serve a rendered page image."""
+    """Serve a rendered page image. Falls back to the rendered-page cache
+    once the local preview has been cleaned up."""
     img_path = OUTPUT_DIR / job_id / "pages" / f"page_{page_num}.png"
-    if not img_path.exists():
-        raise HTTPException(404, "Page image not found")
-    return FileResponse(str(img_path), media_type="image/png")
+    if img_path.exists():
+        return FileResponse(str(img_path), media_type="image/png")
+    cache_key = (jobs.get(job_id) or {}).get("page_cache_key")
+    if _page_cache and cache_key and page_num >= 1:
+        arr = _page_cache.load_array(cache_key, page_num - 1)
+        if arr is not None:
+            buf = io.BytesIO()
+            PILImage.fromarray(arr).save(buf, format="PNG", compress_level=1)
+            return Response(buf.getvalue(), media_type="image/png")
+    raise HTTPException(404, "Page image not found")
 
 
 @app.get("/api/checks/{job_id}/{check_id}/image")
 def get_check_image(job_id: str, check_id: str):
     """Get the cropped check image. Falls back to Supabase Storage if local file was cleaned up."""
-    img_path = OUTPUT_DIR / job_id / "images" / f"{check_id}.png"
-    if img_path.exists():
-        return FileResponse(str(img_path), media_type="image/png")
+    img_path = find_crop_image(OUTPUT_DIR / job_id / "images", check_id)
+    if img_path:
+        return FileResponse(img_path, media_type=image_mime(img_path))
     # Fallback: check in-memory job for storage_url
     job = jobs.get(job_id)
     if job:
@@ -1769,7 +1959,7 @@ def get_check_image(job_id: str, check_id: str):
                     return RedirectResponse(url)
     # Fallback: construct Supabase Storage URL
     if _supabase_ok:
-        storage_url = f"{_sb_url}/storage/v1/object/public/checks/jobs/{job_id}/images/{check_id}.png"
+        storage_url = f"{_sb_url}/storage/v1/object/public/checks/jobs/{job_id}/images/{_crop_image_file(job, check_id)}"
         return RedirectResponse(storage_url)
     raise HTTPException(404, "Check image not found")
 
@@ -2825,7 +3015,7 @@ if __name__ == "__main__":
                         
                         # Check if there are page images to extract from
                         images_dir = job_dir / "images"
-                        if not images_dir.exists() or not any(images_dir.glob("*.png")):
+                        if not images_dir.exists() or not any(images_dir.glob("check_*.*")):
                             print(f"  ⏭️  Skipping {job_id} - no page images found")
                             continue
                         
@@ -2838,19 +3028,21 @@ if __name__ == "__main__":
                                 job_dir = str(OUTPUT_DIR / jid)
                                 
                                 # Initialize CheckExtractorApp without PDF (re-extraction mode)
-                                app_ext = CheckExtractorApp(None, output_dir=job_dir)
+                                app_ext = CheckExtractorApp(None, output_dir=job_dir, crop_index=_crop_index)
                                 
                                 # Build manifest from existing check images
                                 images_dir = Path(job_dir) / "images"
                                 manifest = []
-                                for img_file in sorted(images_dir.glob("check_*.png")):
+                                for img_file in sorted(images_dir.glob("check_*.*")):
+                                    if img_file.suffix not in CROP_IMAGE_MIMES:
+                                        continue
                                     # Extract check_id and page from filename (format: check_001_p1.png)
                                     stem = img_file.stem  # e.g., "check_001_p1"
                                     parts = stem.split('_')
                                     if len(parts) >= 3:
                                         check_id = f"{parts[1]}"  # "001"
                                         page_num = int(parts[2][1:]) if parts[2].startswith('p') else 1
-                                        manifest.append((check_id, str(img_file), page_num))
+                                        manifest.append(CheckCrop(check_id, page_num, str(img_file)))
                                 
                                 if not manifest:
                                     print(f"  ⚠️  No check images found in {images_dir}")
@@ -2897,6 +3089,9 @@ if __name__ == "__main__":
                                         "engine_results": c.get("engine_results", {}),
                                         "engine_extractions": c.get("engine_extractions", {}),
                                         "engine_times_ms": c.get("engine_times_ms", {}),
+                                        "deduplicated": c.get("deduplicated"),
+                                        "image_file": c.get("image_file"),
+                                        "image_bytes": c.get("image_bytes"),
                                     })
                                 
                                 _supabase_update("check_jobs", {"job_id": jid}, {
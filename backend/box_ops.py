@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Vectorized box operations for the check detector.
+
+Boxes are (x1, y1, x2, y2) pixel rectangles. Boxes holds a set of them as
+one compact (N, 4) int32 array, so overlap tests run as NumPy passes over
+all candidates instead of pairwise Python loops. Per-box pixel statistics
+come from summed-area tables (integral / box_sums) in O(1) per box.
+"""
+
+import cv2
+import numpy as np
+
+
+class Boxes:
+    """N boxes as an (N, 4) int32 array of x1, y1, x2, y2."""
+    __slots__ = ("xyxy",)
+
+    def __init__(self, boxes=()):
+        arr = np.asarray(boxes, dtype=np.int32)
+        self.xyxy = arr.reshape(-1, 4)
+
+    def __len__(self):
+        return len(self.xyxy)
+
+    def __iter__(self):
+        return (tuple(b) for b in self.xyxy.tolist())
+
+    def __getitem__(self, idx):
+        return Boxes(self.xyxy[idx])
+
+    @property
+    def areas(self):
+        return (self.xyxy[:, 2] - self.xyxy[:, 0]).astype(np.int64) * (self.xyxy[:, 3] - self.xyxy[:, 1])
+
+    def tolist(self):
+        return list(self)
+
+
+def intersection_areas(a, b):
+    """(len(a), len(b)) matrix of intersection areas (0 where disjoint)."""
+    a, b = a.xyxy, b.xyxy
+    iw = np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0])
+    ih = np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1])
+    return np.clip(iw, 0, None).astype(np.int64) * np.clip(ih, 0, None)
+
+
+def suppress(boxes, threshold=0.35):
+    """Indices of boxes kept by greedy suppression, largest area first.
+    A box is dropped when its overlap with an already-kept box exceeds
+    `threshold` of its own (the smaller) area."""
+    if not isinstance(boxes, Boxes):
+        boxes = Boxes(boxes)
+    if not len(boxes):
+        return []
+    areas = boxes.areas
+    order = np.argsort(-areas, kind="stable")
+    x1, y1, x2, y2 = boxes.xyxy[order].T
+    areas = areas[order]
+    alive = np.ones(len(order), dtype=bool)
+    for i in range(len(order)):
+        if not alive[i]:
+            continue
+        # Overlap of kept box i with every later (smaller) box, in one pass
+        iw = np.minimum(x2[i], x2[i + 1:]) - np.maximum(x1[i], x1[i + 1:])
+        ih = np.minimum(y2[i], y2[i + 1:]) - np.maximum(y1[i], y1[i + 1:])
+        inter = np.clip(iw, 0, None).astype(np.int64) * np.clip(ih, 0, None)
+        alive[i + 1:] &= inter <= threshold * areas[i + 1:]
+    return order[alive].tolist()
+
+
+def drop_nested(boxes):
+    """Indices of boxes not contained in another box (the children in a
+    component hierarchy). Of identical boxes the first is kept."""
+    if not isinstance(boxes, Boxes):
+        boxes = Boxes(boxes)
+    n = len(boxes)
+    if n < 2:
+        return list(range(n))
+    areas = boxes.areas
+    inside = intersection_areas(boxes, boxes) == areas[None, :]   # [i, j]: j lies within i
+    larger = (areas[:, None] > areas[None, :]) | np.tri(n, k=-1, dtype=bool).T
+    np.fill_diagonal(inside, False)
+    return np.flatnonzero(~(inside & larger).any(axis=0)).tolist()
+
+
+def overlaps_any(box, others, threshold=0.20):
+    """True if `box` overlaps any of `others` by more than `threshold` of its area."""
+    if not len(others):
+        return False
+    one = Boxes([box])
+    area = max(int(one.areas[0]), 1)
+    if not isinstance(others, Boxes):
+        others = Boxes(others)
+    return bool((intersection_areas(one, others) > threshold * area).any())
+
+
+def integral(plane, max_value=1):
+    """Summed-area table of a 2D plane, shape (H+1, W+1), so any box sum is
+    four lookups. int32 when the whole-plane sum fits (max_value is the
+    largest pixel value: 1 for masks, 255 for 8-bit intensities), else an
+    exact float64 table."""
+    fits = plane.size * max_value < 2 ** 31
+    return cv2.integral(plane, sdepth=cv2.CV_32S if fits else cv2.CV_64F)
+
+
+def box_sums(sat, boxes):
+    """Sum of the plane under each (x1, y1, x2, y2) box, from its table."""
+    if not isinstance(boxes, Boxes):
+        boxes = Boxes(boxes)
+    x1, y1, x2, y2 = boxes.xyxy.T
+    return (sat[y2, x2].astype(np.float64) - sat[y1, x2] - sat[y2, x1] + sat[y1, x1])
@@ -21,20 +21,32 @@ Backend schema (from backend/src/types/extraction.ts):
 import os
 import re
 import sys
+import html
 import cv2
 import json
+import math
+import shutil
+import threading
 import base64
 import time
+import subprocess
+import tempfile
 import requests
 import numpy as np
 from io import BytesIO
 from datetime import datetime
 from collections import Counter, defaultdict
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from pdf2image import convert_from_path
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from pdf2image import convert_from_path, pdfinfo_from_path
 from PIL import Image
 import pytesseract
 
+from page_cache import PageCache, file_sha256
+from layout_store import LayoutStore
+from crop_index import CropIndex, crop_fingerprint, fingerprint_file, match_crops, pixel_sha256
+from box_ops import Boxes, suppress, overlaps_any, drop_nested, integral, box_sums
+
 # OpenAI for backup
 try:
     from openai import OpenAI
@@ -79,28 +91,471 @@ if OPENAI_API_KEY and OPENAI_AVAILABLE:
 elif OPENAI_API_KEY and not OPENAI_AVAILABLE:
     print("WARNING: OPENAI_API_KEY set but openai library not installed.")
 
+# Rasterization. By default every page is kept in memory (self.pages).
+# STREAM_RASTER switches to windowed rendering: at most RASTER_PAGE_BUDGET
+# pages are alive at once and detection + cropping run as each window arrives.
+RASTER_DPI = 300
+STREAM_RASTER = os.environ.get("STREAM_RASTER", "").lower() in ("true", "1", "yes")
+RASTER_PAGE_BUDGET = max(1, int(os.environ.get("RASTER_PAGE_BUDGET", "") or 4))
+# RASTER_GRAYSCALE renders pages as 8-bit gray (1/3 of the RGB memory); only
+# the final check crops are re-rendered in colour, straight from the PDF.
+RASTER_GRAYSCALE = os.environ.get("RASTER_GRAYSCALE", "").lower() in ("true", "1", "yes")
+# RASTER_WORKERS shards a page range over that many pdftoppm processes
+# (0 = auto from CPU count, each worker getting >= RASTER_MIN_SHARD_PAGES pages).
+RASTER_WORKERS = max(0, int(os.environ.get("RASTER_WORKERS", "") or 0))
+RASTER_MIN_SHARD_PAGES = 4
+# RASTER_DETECT_DPI enables two-pass mode: pages are rendered at this lower DPI
+# for detection, and only the detected check regions are rendered at RASTER_DPI.
+RASTER_DETECT_DPI = max(0, int(os.environ.get("RASTER_DETECT_DPI", "") or 0))
+# RASTER_EMBEDDED_IMAGES: pages that are nothing but one full-page scan are
+# taken from the embedded bitmap at native resolution instead of re-rendered.
+RASTER_EMBEDDED_IMAGES = os.environ.get("RASTER_EMBEDDED_IMAGES", "").lower() in ("true", "1", "yes")
+
+# TEXT_LAYER_PREFILL reads check number / date / amount from the PDF text layer
+# (digitally generated statements) before OCR, so engines only need the
+# handwritten fields.
+TEXT_LAYER_PREFILL = os.environ.get("TEXT_LAYER_PREFILL", "").lower() in ("true", "1", "yes")
+TEXT_LAYER_FIELDS = ("checkNumber", "checkDate", "amount")
+
+# Preflight limits: files past these are rejected before any page is rendered.
+# PREFLIGHT_MAX_PAGE_MP is megapixels of one page at RASTER_DPI (letter ≈ 8.4).
+PREFLIGHT_MAX_PAGES = int(os.environ.get("PREFLIGHT_MAX_PAGES", "") or 2000)
+PREFLIGHT_MAX_PAGE_MP = float(os.environ.get("PREFLIGHT_MAX_PAGE_MP", "") or 200)
+PREFLIGHT_MAX_PAGE_IMAGES = int(os.environ.get("PREFLIGHT_MAX_PAGE_IMAGES", "") or 500)
+
+# DETECT_SCALE runs the detector on the page downsampled by this factor
+# (e.g. 0.5) and maps boxes back to full resolution; 1 = full resolution.
+# Check parity on real documents with detect_parity.py before lowering it.
+DETECT_SCALE = min(1.0, max(0.1, float(os.environ.get("DETECT_SCALE", "") or 1.0)))
+# DETECT_PROCESSES detects pages in worker processes (page planes are passed
+# through shared memory, only boxes come back) instead of GIL-bound threads.
+# DETECT_WORKERS caps the processes (0 = auto from CPU and page count).
+DETECT_PROCESSES = os.environ.get("DETECT_PROCESSES", "").lower() in ("true", "1", "yes")
+DETECT_WORKERS = max(0, int(os.environ.get("DETECT_WORKERS", "") or 0))
+DETECT_MIN_PAGES_PER_WORKER = 2
+# DETECT_METHOD picks how bordered (Format A) candidates are found:
+# "contours" walks the cv2.findContours RETR_TREE hierarchy; "components"
+# takes connected-component stats in one call and drops nested boxes.
+DETECT_METHODS = ("contours", "components")
+DETECT_METHOD = os.environ.get("DETECT_METHOD", "").strip().lower() or "contours"
+if DETECT_METHOD not in DETECT_METHODS:
+    print(f"WARNING: unknown DETECT_METHOD {DETECT_METHOD!r}, using contours")
+    DETECT_METHOD = "contours"
+# DETECT_LAYOUT_REUSE remembers line-grid layouts within a job: a page whose
+# ruling signature (positions of long rules in its row/column projection
+# profiles) matches an earlier page takes that page's cells and only runs the
+# per-cell ink validation. Set to false to detect every grid from scratch.
+DETECT_LAYOUT_REUSE = (os.environ.get("DETECT_LAYOUT_REUSE", "") or "true").lower() in ("true", "1", "yes")
+DETECT_LAYOUT_MEMO = 4        # layouts remembered per job (most recent first)
+DETECT_LAYOUT_MIN_RULES = 5   # horizontal rules a signature needs to be reused
+# PRE_OCR_GATE lists the checks run on detected boxes before they are cropped
+# and sent to OCR (comma-separated, in this order): "snap" moves bordered
+# boxes onto their rectangle edges, "shape" drops cells whose aspect is not
+# check-like, "blanks" drops boxes with (almost) no ink inside the border,
+# "backs" drops endorsement sides. "none" disables the gate.
+PRE_OCR_GATE_STEPS = ("snap", "shape", "blanks", "backs")
+_gate_env = {g.strip().lower() for g in (os.environ.get("PRE_OCR_GATE", "") or "blanks,backs").split(",")}
+if _gate_env - set(PRE_OCR_GATE_STEPS) - {"", "none"}:
+    print(f"WARNING: unknown PRE_OCR_GATE steps {sorted(_gate_env - set(PRE_OCR_GATE_STEPS) - {'', 'none'})}")
+PRE_OCR_GATE = tuple(g for g in PRE_OCR_GATE_STEPS if g in _gate_env)
+PRE_OCR_MIN_INK = 0.005              # "blanks": dark fraction inside an 8% inset
+PRE_OCR_ASPECT = (1.2, 4.5)          # "shape": check width / height range
+
+# ═════════════════════════════════════════════════════════════════════
+#  CROP ENCODING
+# ═════════════════════════════════════════════════════════════════════
+# CROP_PROFILE picks how check crops are encoded: "png" (PIL default level),
+# "png-fast" (compress level 1), "webp" (lossless, fastest method) or "jpeg"
+# (quality 92, no chroma subsampling; lossy - for LLM-only OCR).
+CROP_PROFILES = {
+    "png": {"format": "PNG", "ext": ".png", "mime": "image/png", "params": {}},
+    "png-fast": {"format": "PNG", "ext": ".png", "mime": "image/png", "params": {"compress_level": 1}},
+    "webp": {"format": "WEBP", "ext": ".webp", "mime": "image/webp", "params": {"lossless": True, "method": 0}},
+    "jpeg": {"format": "JPEG", "ext": ".jpg", "mime": "image/jpeg", "params": {"quality": 92, "subsampling": 0}},
+}
+CROP_IMAGE_MIMES = {p["ext"]: p["mime"] for p in CROP_PROFILES.values()}
+CROP_PROFILE = os.environ.get("CROP_PROFILE", "").strip().lower() or "png"
+if CROP_PROFILE not in CROP_PROFILES:
+    print(f"WARNING: unknown CROP_PROFILE {CROP_PROFILE!r}, using png")
+    CROP_PROFILE = "png"
+# Crops are handed to the OCR engines in memory (pixels and encoded bytes)
+# up to this many MB of pixels per job; later crops are read back from disk.
+CROP_HANDOFF_MB = int(os.environ.get("CROP_HANDOFF_MB", "") or 256)
+# Background crop writers; with a single CPU crops are written inline
+CROP_WRITE_WORKERS = min(4, os.cpu_count() or 1)
+TMPFS_DIR = "/dev/shm"
+
+
+def image_mime(path):
+    """MIME type of a crop image (or CropImage) from its extension (PNG if unknown)."""
+    if isinstance(path, CropImage):
+        return path.mime
+    return CROP_IMAGE_MIMES.get(os.path.splitext(path)[1].lower(), "image/png")
+
+
+def find_crop_image(img_dir, check_id):
+    """Path of a check's crop in img_dir, whatever profile wrote it, or None."""
+    for ext in CROP_IMAGE_MIMES:
+        path = os.path.join(str(img_dir), f"{check_id}{ext}")
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def tmpfs_output_dir(name):
+    """<TMPFS_DIR>/<name> for a RAM-backed output folder, or None (with a
+    warning) where there is no writable tmpfs."""
+    if not (os.path.isdir(TMPFS_DIR) and os.access(TMPFS_DIR, os.W_OK)):
+        print(f"WARNING: {TMPFS_DIR} is not available; writing output to disk")
+        return None
+    return os.path.join(TMPFS_DIR, name)
+
+
+class CheckCrop:
+    """One cropped check, as produced by extract_all_images and consumed by
+    Phase 2, the summary and the API in place of (check_id, path, page)
+    tuples. bbox is the full-DPI page box, width/height the crop's pixel
+    size, sha256 the pixel hash (crop_index.pixel_sha256) and image_bytes
+    the encoded file size (set once the write finishes). to_json/from_json
+    round-trip a record losslessly; fields a record was built without
+    (e.g. from files on disk) are None."""
+    __slots__ = ("check_id", "page", "image_path", "page_path", "bbox",
+                 "width", "height", "sha256", "image_bytes")
+
+    def __init__(self, check_id, page, image_path, page_path=None, bbox=None,
+                 width=None, height=None, sha256=None, image_bytes=None):
+        self.check_id = check_id
+        self.page = page
+        self.image_path = image_path
+        self.page_path = page_path
+        self.bbox = tuple(int(v) for v in bbox) if bbox is not None else None
+        self.width = width
+        self.height = height
+        self.sha256 = sha256
+        self.image_bytes = image_bytes
+
+    @property
+    def image_file(self):
+        return os.path.basename(self.image_path)
+
+    def to_json(self, paths=True):
+        """JSON-ready dict of every field, plus image_file. paths=False leaves
+        out the local file paths (for output that leaves this machine)."""
+        out = {name: getattr(self, name) for name in self.__slots__}
+        out["bbox"] = list(self.bbox) if self.bbox is not None else None
+        out["image_file"] = self.image_file
+        if not paths:
+            del out["image_path"], out["page_path"]
+        return out
+
+    @classmethod
+    def from_json(cls, data):
+        """Record from to_json() output (or an API check dict); other keys are ignored."""
+        return cls(**{name: data.get(name) for name in cls.__slots__})
+
+    def __repr__(self):
+        return f"CheckCrop({self.check_id!r}, page={self.page}, {self.image_file!r})"
+
+
+class CropImage:
+    """A check crop handed from Phase 1 to the OCR engines in memory.
+    Encoding and the disk write run on a writer thread (write); engines take
+    the pixels (Tesseract) or the encoded bytes (Gemini/OpenAI) from here
+    instead of reading the file back. Anything that needs the file itself
+    gets it through os.fspath, which waits for the write. Crops beyond the
+    handoff budget (keep=False) drop their pixels once written and are read
+    from disk like before; release() drops the buffers after OCR, once the
+    write has finished."""
+    __slots__ = ("path", "mime", "size", "sha256", "_pixels", "_data", "_written")
+
+    def __init__(self, path, crop, profile):
+        self.path = path
+        self.mime = profile["mime"]
+        # Own copy: a view would keep the whole page buffer alive
+        self._pixels = np.array(crop)
+        self.size = (self._pixels.shape[1], self._pixels.shape[0])
+        self.sha256 = None
+        self._data = None
+        self._written = threading.Event()
+
+    def __fspath__(self):
+        self._written.wait()
+        return self.path
+
+    def write(self, profile, links=(), keep=True, digest=False):
+        """Encode to the crop profile, write the file and its per-page links;
+        returns the byte size (writer thread). digest also sets sha256
+        (crop_index.pixel_sha256)."""
+        try:
+            pixels = self._pixels
+            if digest:
+                self.sha256 = pixel_sha256(pixels)
+            buf = BytesIO()
+            Image.fromarray(pixels).save(buf, profile["format"], **profile["params"])
+            data = buf.getvalue()
+            with open(self.path, "wb") as f:
+                f.write(data)
+            for link in links:
+                _link_file(self.path, link)
+            if keep:
+                self._data = data
+            else:
+                self._pixels = None
+            return len(data)
+        finally:
+            self._written.set()
+
+    def pixels(self):
+        """RGB (or grayscale) array, or None once released."""
+        return self._pixels
+
+    def data(self):
+        """Encoded file bytes (after the write), or None once released."""
+        self._written.wait()
+        return self._data
+
+    def release(self):
+        """Drop the buffers (after the write, which still needs the pixels)."""
+        self._written.wait()
+        self._pixels = self._data = None
+
+
+def _crop_gray(image):
+    """Grayscale pixels of a crop: a CropImage's buffer, else read from disk."""
+    pixels = image.pixels() if isinstance(image, CropImage) else None
+    if pixels is None:
+        return cv2.cvtColor(cv2.imread(os.fspath(image)), cv2.COLOR_BGR2GRAY)
+    return pixels if pixels.ndim == 2 else cv2.cvtColor(pixels, cv2.COLOR_RGB2GRAY)
+
+
+def _crop_bytes(image):
+    """Encoded bytes of a crop: a CropImage's buffer, else read from disk."""
+    data = image.data() if isinstance(image, CropImage) else None
+    if data is None:
+        with open(image, "rb") as f:
+            data = f.read()
+    return data
+
 
 # ═════════════════════════════════════════════════════════════════════
 #  AUTOMATIC VISION DETECTOR (OpenCV)
 # ═════════════════════════════════════════════════════════════════════
 
-def determine_predominant_format(pages, sample_count=3):
+class PageBuffer:
+    """A rasterized page held as one numpy buffer (H×W gray or H×W×3 RGB).
+    The grayscale plane is derived once on first use; crops are views into
+    the buffer. Pixels become a PIL image only when encoded (to_image)."""
+    __slots__ = ("pixels", "_gray", "_preps")
+
+    def __init__(self, page):
+        self.pixels = page if isinstance(page, np.ndarray) else np.asarray(page)
+        self._gray = None
+        self._preps = {}
+
+    @property
+    def gray(self):
+        if self._gray is None:
+            if self.pixels.ndim == 2:
+                self._gray = self.pixels
+            else:
+                self._gray = cv2.cvtColor(np.ascontiguousarray(self.pixels), cv2.COLOR_RGB2GRAY)
+        return self._gray
+
+    @property
+    def width(self):
+        return self.pixels.shape[1]
+
+    @property
+    def height(self):
+        return self.pixels.shape[0]
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+    def crop(self, box):
+        """View of the (x1, y1, x2, y2) region; no pixels are copied."""
+        x1, y1, x2, y2 = box
+        return self.pixels[y1:y2, x1:x2]
+
+    def gray_crop(self, box):
+        x1, y1, x2, y2 = box
+        return self.gray[y1:y2, x1:x2]
+
+    def to_image(self):
+        return Image.fromarray(self.pixels)
+
+    def prep(self, scale, method=None, dpi_ratio=1.0):
+        """Memoized PagePrep of this page at a detection scale and method."""
+        key = (scale, method or DETECT_METHOD, dpi_ratio)
+        if key not in self._preps:
+            self._preps[key] = PagePrep(self.gray, scale, method, dpi_ratio)
+        return self._preps[key]
+
+
+def _as_image(pixels):
+    """PIL image for an array view (encode time) or an image already in PIL."""
+    return pixels if isinstance(pixels, Image.Image) else Image.fromarray(pixels)
+
+
+def _page_gray(page):
+    """8-bit grayscale array for a PageBuffer, or an RGB / grayscale page."""
+    if isinstance(page, PageBuffer):
+        return page.gray
+    img = np.asarray(page)
+    if img.ndim == 2:
+        return img
+    return cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+
+
+def _detection_gray(page, scale):
+    """Grayscale plane the detector runs on: the page itself at scale 1,
+    else downsampled by `scale` (area-averaged, so thin rules stay dark)."""
+    gray = _page_gray(page)
+    if scale >= 1:
+        return gray
+    h, w = gray.shape
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+
+
+def _upscale_boxes(boxes, scale, h, w):
+    """Map boxes found at `scale` back to full-resolution (h, w) pixels."""
+    if scale >= 1:
+        return boxes
+    return [(int(x1 / scale), int(y1 / scale),
+             min(w, math.ceil(x2 / scale)), min(h, math.ceil(y2 / scale)))
+            for (x1, y1, x2, y2) in boxes]
+
+
+def _px(n, scale):
+    """A pixel constant tuned at full resolution, at detection scale."""
+    return max(1, int(round(n * scale)))
+
+
+class PagePrep:
+    """Per-page detector preprocessing at one scale, each stage computed on
+    first use: gray plane, binarized `bw`, summed-area tables for box
+    statistics, contour candidates and line-grid cells. Shared by format
+    voting, detection and the later box stages. drop_planes() frees the
+    image planes and tables but keeps the candidate boxes.
+    dpi_ratio: the page's DPI over the DPI the pixel constants are tuned for
+    (pages rendered at RASTER_DETECT_DPI or taken from an embedded scan);
+    px_scale = scale * dpi_ratio is what _px() constants are scaled by."""
+    __slots__ = ("full_gray", "scale", "px_scale", "method", "_gray", "_bw", "_ink_sat", "_gray_sat",
+                 "_dark_sat", "_contours", "_grid")
+
+    def __init__(self, full_gray, scale=1.0, method=None, dpi_ratio=1.0):
+        self.full_gray = full_gray
+        self.scale = scale
+        self.px_scale = scale * dpi_ratio
+        self.method = method or DETECT_METHOD
+        self._gray = self._bw = self._contours = self._grid = None
+        self._ink_sat = self._gray_sat = self._dark_sat = None
+
+    @property
+    def full_shape(self):
+        return self.full_gray.shape[:2]
+
+    @property
+    def gray(self):
+        if self._gray is None:
+            self._gray = _detection_gray(self.full_gray, self.scale)
+        return self._gray
+
+    @property
+    def shape(self):
+        return self.gray.shape[:2]
+
+    @property
+    def bw(self):
+        if self._bw is None:
+            _, self._bw = cv2.threshold(self.gray, 200, 255, cv2.THRESH_BINARY_INV)
+        return self._bw
+
+    @property
+    def ink_sat(self):
+        """Summed-area table of ink pixels (bw > 0)."""
+        if self._ink_sat is None:
+            self._ink_sat = integral((self.bw > 0).view(np.uint8))
+        return self._ink_sat
+
+    @property
+    def gray_sat(self):
+        """Summed-area table of gray intensities."""
+        if self._gray_sat is None:
+            self._gray_sat = integral(self.gray, max_value=255)
+        return self._gray_sat
+
+    @property
+    def dark_sat(self):
+        """Summed-area table of dark pixels (gray < 180)."""
+        if self._dark_sat is None:
+            self._dark_sat = integral((self.gray < 180).view(np.uint8))
+        return self._dark_sat
+
+    @property
+    def contour_boxes(self):
+        """Deduplicated bordered-box candidates from the prep's method (do not mutate)."""
+        if self._contours is None:
+            h, w = self.shape
+            find = _detect_by_components if self.method == "components" else _detect_by_contours
+            self._contours = _deduplicate_boxes(find(self.bw, h, w, self.ink_sat))
+        return self._contours
+
+    @property
+    def grid_boxes(self):
+        """Line-grid cells (do not mutate)."""
+        if self._grid is None:
+            h, w = self.shape
+            self._grid = _detect_by_line_grid(self.bw, self.gray, h, w, self.px_scale)
+        return self._grid
+
+    def layout_grid(self, layouts=None):
+        """grid_boxes, taken from `layouts` (a LayoutMemo) when an earlier
+        page had the same ruling signature; new layouts are remembered."""
+        if layouts is None or self._grid is not None:
+            return self.grid_boxes
+        signature = _layout_signature(self.bw, self.px_scale)
+        cells = layouts.lookup(signature)
+        if cells is None:
+            layouts.remember(signature, self.grid_boxes)
+        else:
+            self._grid = cells
+        return self._grid
+
+    def drop_planes(self):
+        self._gray = self._bw = None
+        self._ink_sat = self._gray_sat = self._dark_sat = None
+
+
+def _page_prep(page, scale, method=None, dpi_ratio=1.0):
+    """PagePrep for a page; memoized on PageBuffers, one-off for PIL/arrays."""
+    if isinstance(page, PageBuffer):
+        return page.prep(scale, method, dpi_ratio)
+    return PagePrep(_page_gray(page), scale, method, dpi_ratio)
+
+
+def determine_predominant_format(pages, sample_count=3, scale=None, method=None, layouts=None,
+                                 dpi_ratios=None):
     """
     Analyze the first few pages of a PDF to determine the predominant
     detection format used throughout the document.
     Returns 'A' (contour/bordered), 'B' (line-grid), or None (unknown).
+    scale: detection scale (defaults to DETECT_SCALE).
+    method: candidate finder, see DETECT_METHODS (defaults to DETECT_METHOD).
+    layouts: optional LayoutMemo; sampled grids are looked up / remembered.
+    dpi_ratios: per-page DPI over the tuned DPI (see PagePrep; default 1).
     """
+    scale = DETECT_SCALE if scale is None else scale
     votes = {"A": 0, "B": 0}
     sample = pages[:min(sample_count, len(pages))]
 
-    for page in sample:
-        img = np.array(page)
-        gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
-        h, w = gray.shape
-        _, bw = cv2.threshold(gray, 200, 255, cv2.THRESH_BINARY_INV)
-
-        contour_boxes = _deduplicate_boxes(_detect_by_contours(bw, h, w))
-        grid_boxes = _detect_by_line_grid(bw, gray, h, w)
+    for i, page in enumerate(sample):
+        prep = _page_prep(page, scale, method, dpi_ratios[i] if dpi_ratios else 1.0)
+        w = prep.shape[1]
+        contour_boxes = prep.contour_boxes
+        grid_boxes = prep.layout_grid(layouts)
 
         avg_cw = 0
         if contour_boxes:
@@ -118,38 +573,48 @@ def determine_predominant_format(pages, sample_count=3):
     return None
 
 
-def detect_checks_on_page(pil_page, format_hint=None):
+def detect_checks_on_page(pil_page, format_hint=None, scale=None, method=None, layouts=None,
+                          gate=None, dpi_ratio=1.0):
     """
     Smart hybrid detection with predominant format awareness.
     format_hint: 'A' (contour/bordered), 'B' (line-grid), or None (auto-detect).
+    scale: run on the page downsampled by this factor (defaults to DETECT_SCALE).
+    method: bordered-box finder, "contours" or "components" (defaults to DETECT_METHOD).
+    layouts: optional LayoutMemo shared by the pages of one job, so repeated
+      line-grid templates are not re-detected.
+    gate: optional PreOcrGate run on the validated boxes (backs, blanks, ...);
+      it counts what it drops.
+    dpi_ratio: the page's DPI over the DPI the detector's pixel constants are
+      tuned for (RASTER_DPI), e.g. 0.5 for a page rendered at 150 DPI.
     Returns list of (x1, y1, x2, y2) in original-pixel coords.
     """
-    img = np.array(pil_page)
-    gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
-    h, w = gray.shape
-    _, bw = cv2.threshold(gray, 200, 255, cv2.THRESH_BINARY_INV)
+    scale = DETECT_SCALE if scale is None else scale
+    prep = _page_prep(pil_page, scale, method, dpi_ratio)
+    full_h, full_w = prep.full_shape
+    return _upscale_boxes(_detect_on_prep(prep, format_hint, layouts, gate), scale, full_h, full_w)
 
-    # ── Run both detection methods ────────────────────────────────
-    contour_boxes = _deduplicate_boxes(_detect_by_contours(bw, h, w))
-    grid_boxes = _detect_by_line_grid(bw, gray, h, w)
 
-    # ── Format selection (use hint if available) ──────────────────
-    avg_contour_w = 0
-    if contour_boxes:
-        avg_contour_w = np.mean([b[2] - b[0] for b in contour_boxes]) / w
+def _detect_on_prep(prep, format_hint, layouts=None, gate=None):
+    """detect_checks_on_page on a PagePrep (boxes at detection scale).
+    Each detection method runs only if the format path needs it."""
+    h, w = prep.shape
 
+    # ── Format selection (use hint if available) ──────────────────
     if format_hint == "A":
         # Predominant format is contour/bordered — use contours on this page
+        contour_boxes = prep.contour_boxes
+        from_contours = bool(contour_boxes)
         if contour_boxes:
             merged = list(contour_boxes)
         else:
-            merged = list(grid_boxes)  # fallback if no contours at all
+            merged = list(prep.layout_grid(layouts))  # fallback if no contours at all
     elif format_hint == "B":
         # Predominant format is line-grid — use full grid cells
         # Filter out full-width cells (summary/header rows on non-check pages)
         # Real FORMAT B checks are half-width (split by vertical divider)
         half_w = w * 0.55
-        valid_grid = [b for b in grid_boxes if (b[2] - b[0]) < half_w]
+        from_contours = False
+        valid_grid = [b for b in prep.layout_grid(layouts) if (b[2] - b[0]) < half_w]
         if len(valid_grid) >= 4:
             merged = list(valid_grid)
         else:
@@ -157,6 +622,12 @@ def detect_checks_on_page(pil_page, format_hint=None):
             merged = []
     else:
         # Auto-detect per page (no hint available)
+        contour_boxes = prep.contour_boxes
+        grid_boxes = prep.layout_grid(layouts)
+        avg_contour_w = 0
+        if contour_boxes:
+            avg_contour_w = np.mean([b[2] - b[0] for b in contour_boxes]) / w
+        from_contours = len(contour_boxes) >= 2 and (avg_contour_w > 0.30 or len(grid_boxes) < 8)
         if len(contour_boxes) >= 2 and avg_contour_w > 0.30:
             merged = list(contour_boxes)
         elif len(grid_boxes) >= 8:
@@ -170,20 +641,28 @@ def detect_checks_on_page(pil_page, format_hint=None):
 
     merged = _deduplicate_boxes(merged)
 
-    # ── Final validation ──────────────────────────────────────────
+    # ── Final validation (box statistics from summed-area tables) ─
     good = []
-    for (x1, y1, x2, y2) in merged:
-        roi = gray[y1:y2, x1:x2]
-        if roi.size == 0:
-            continue
-        if np.mean(roi) > 250:
-            continue
-        if (x2 - x1) < w * 0.10 or (y2 - y1) < h * 0.03:
-            continue
-        dark_px = np.sum(roi < 180)
-        if dark_px / max(roi.size, 1) < 0.02:
-            continue
-        good.append((x1, y1, x2, y2))
+    if merged:
+        clipped = [(min(max(x1, 0), w), min(max(y1, 0), h), min(max(x2, x1, 0), w), min(max(y2, y1, 0), h))
+                   for (x1, y1, x2, y2) in merged]
+        intensity = box_sums(prep.gray_sat, clipped)
+        dark = box_sums(prep.dark_sat, clipped)
+        for box, (cx1, cy1, cx2, cy2), total, dark_px in zip(merged, clipped, intensity, dark):
+            x1, y1, x2, y2 = box
+            area = (cx2 - cx1) * (cy2 - cy1)
+            if area == 0:
+                continue
+            if total / area > 250:
+                continue
+            if (x2 - x1) < w * 0.10 or (y2 - y1) < h * 0.03:
+                continue
+            if dark_px / area < 0.02:
+                continue
+            good.append((x1, y1, x2, y2))
+
+    if gate and good:
+        good = gate.apply(prep, good, from_contours)
 
     good.sort(key=lambda r: (r[1], r[0]))
 
@@ -197,23 +676,15 @@ def detect_checks_on_page(pil_page, format_hint=None):
 
 def _box_overlaps_any(box, others, threshold=0.20):
     """Check if box overlaps with any box in others."""
-    for ob in others:
-        ox1, oy1 = max(box[0], ob[0]), max(box[1], ob[1])
-        ox2, oy2 = min(box[2], ob[2]), min(box[3], ob[3])
-        if ox1 < ox2 and oy1 < oy2:
-            overlap_area = (ox2 - ox1) * (oy2 - oy1)
-            box_area = max((box[2] - box[0]) * (box[3] - box[1]), 1)
-            if overlap_area > threshold * box_area:
-                return True
-    return False
-
-
-def _add_sub_contour(grid_box, bw, merged):
+    return overlaps_any(box, others, threshold)
+
+
+def _add_sub_contour(grid_box, bw, merged, scale=1.0):
     """Find the best check contour inside a grid cell and add to merged."""
     gx1, gy1, gx2, gy2 = grid_box
     cell_bw = bw[gy1:gy2, gx1:gx2]
     cell_h, cell_w = cell_bw.shape[:2]
-    if cell_h < 50 or cell_w < 50:
+    if cell_h < _px(50, scale) or cell_w < _px(50, scale):
         return
     sub_boxes = _detect_by_contours(cell_bw, cell_h, cell_w)
     if sub_boxes:
@@ -224,7 +695,7 @@ def _add_sub_contour(grid_box, bw, merged):
                            gx1 + best[2], gy1 + best[3]))
 
 
-def _snap_to_contour_edges(boxes, bw, h, w):
+def _snap_to_contour_edges(boxes, bw, h, w, scale=1.0):
     """
     Self-correct box positions by finding the actual bordered rectangle
     edges near each box boundary. This fixes partial crops.
@@ -232,7 +703,7 @@ def _snap_to_contour_edges(boxes, bw, h, w):
     corrected = []
     for (x1, y1, x2, y2) in boxes:
         bh, bw2 = y2 - y1, x2 - x1
-        pad = max(int(bh * 0.15), 10)
+        pad = max(int(bh * 0.15), _px(10, scale))
 
         # Expand search area slightly
         sx1 = max(x1 - pad, 0)
@@ -264,7 +735,7 @@ def _snap_to_contour_edges(boxes, bw, h, w):
     return corrected
 
 
-def _filter_check_backs(boxes, gray):
+def _filter_check_backs(boxes, gray, scale=1.0):
     """
     Filter out check backs (endorsement side) by detecting vertical text.
     Check fronts have horizontal text (payee, amount, bank name).
@@ -293,7 +764,7 @@ def _filter_check_backs(boxes, gray):
         v_ratio = v_text_cols / max(bw2, 1)
 
         # Front checks have MICR line at bottom (dense horizontal ink)
-        bottom_strip = roi_bw[-max(int(bh * 0.15), 10):, :]
+        bottom_strip = roi_bw[-max(int(bh * 0.15), _px(10, scale)):, :]
         bottom_ink = np.sum(bottom_strip > 0) / max(bottom_strip.size, 1)
 
         # Heuristic: if vertical text dominates AND no MICR line → it's a back
@@ -305,44 +776,144 @@ def _filter_check_backs(boxes, gray):
     return fronts
 
 
-def _detect_by_contours(bw, h, w):
-    """Find check rectangles using contour detection."""
+def _drop_blank_boxes(boxes, dark_sat, min_ink=PRE_OCR_MIN_INK):
+    """Keep boxes with ink inside their border: the dark-pixel fraction of
+    the box inset by 8% per side (so rules and frames don't count)."""
+    if not boxes:
+        return boxes
+    arr = np.asarray(boxes, dtype=np.int64)
+    dx = (arr[:, 2] - arr[:, 0]) * 8 // 100
+    dy = (arr[:, 3] - arr[:, 1]) * 8 // 100
+    inner = np.stack([arr[:, 0] + dx, arr[:, 1] + dy, arr[:, 2] - dx, arr[:, 3] - dy], axis=1)
+    h, w = dark_sat.shape[0] - 1, dark_sat.shape[1] - 1
+    inner = np.clip(inner, 0, [w, h, w, h])
+    area = np.maximum((inner[:, 2] - inner[:, 0]) * (inner[:, 3] - inner[:, 1]), 1)
+    ink = box_sums(dark_sat, inner) / area
+    return [b for b, frac in zip(boxes, ink) if frac >= min_ink]
+
+
+def _check_shaped(boxes, aspect=PRE_OCR_ASPECT):
+    """Keep boxes whose width / height lies in the check aspect range."""
+    lo, hi = aspect
+    return [b for b in boxes if lo <= (b[2] - b[0]) / max(b[3] - b[1], 1) <= hi]
+
+
+class PreOcrGate:
+    """Pre-OCR gate on a page's validated boxes (at detection scale): runs
+    the PRE_OCR_GATE_STEPS in `steps`, in order, so check backs, blank crops
+    and non-check cells never reach cropping and OCR. `skipped` counts the
+    boxes each step dropped; thread-safe."""
+
+    def __init__(self, steps=None):
+        steps = PRE_OCR_GATE if steps is None else steps
+        self.steps = tuple(g for g in PRE_OCR_GATE_STEPS if g in set(steps))
+        self.skipped = Counter()
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return bool(self.steps)
+
+    @property
+    def total(self):
+        return sum(self.skipped.values())
+
+    def count(self, skipped):
+        """Add drop counts from elsewhere (e.g. a pool worker's gate)."""
+        with self._lock:
+            self.skipped.update(skipped)
+
+    def apply(self, prep, boxes, from_contours=False):
+        """Boxes that pass every step; `from_contours` enables snapping."""
+        dropped = Counter()
+        h, w = prep.shape
+        for step in self.steps:
+            if not boxes:
+                break
+            n = len(boxes)
+            if step == "snap":
+                if from_contours:
+                    boxes = _snap_to_contour_edges(boxes, prep.bw, h, w, prep.px_scale)
+            elif step == "shape":
+                boxes = _check_shaped(boxes)
+            elif step == "blanks":
+                boxes = _drop_blank_boxes(boxes, prep.dark_sat)
+            elif step == "backs":
+                boxes = _filter_check_backs(boxes, prep.gray, prep.px_scale)
+            if len(boxes) < n:
+                dropped[step] += n - len(boxes)
+        if dropped:
+            self.count(dropped)
+        return boxes
+
+
+def _detect_by_contours(bw, h, w, ink_sat=None):
+    """Find check rectangles using contour detection. All limits are page
+    fractions, so they hold at any detection scale. ink_sat: summed-area
+    table of bw > 0 (computed here if not given) for O(1) ink ratios."""
     contours, _ = cv2.findContours(bw, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
     min_w = int(w * 0.15)
     min_h_box = int(h * 0.04)
     max_h_box = int(h * 0.25)  # checks are never >25% of page height
     min_area = w * h * 0.005
 
-    candidates = []
+    shaped = []
     for c in contours:
         x, y, cw, ch = cv2.boundingRect(c)
         if cw >= min_w and min_h_box <= ch <= max_h_box and cw * ch >= min_area:
             # Aspect ratio: checks are wider than tall (ratio 1.5-6)
             ar = cw / max(ch, 1)
             if 1.2 < ar < 7.0:
-                # Must have enough ink inside (handwriting/print, not empty table cell)
-                roi = bw[y:y+ch, x:x+cw]
-                ink = np.sum(roi > 0) / max(roi.size, 1)
-                if ink > 0.03:  # at least 3% ink
-                    candidates.append((x, y, x + cw, y + ch))
-    return candidates
-
-
-def _detect_by_line_grid(bw, gray, h, w):
-    """Find check cells using horizontal/vertical line detection."""
-    # Horizontal lines
-    horiz_k = cv2.getStructuringElement(cv2.MORPH_RECT, (w // 3, 1))
-    horiz = cv2.morphologyEx(bw, cv2.MORPH_OPEN, horiz_k, iterations=1)
-    row_sums = np.sum(horiz, axis=1) / 255
+                shaped.append((x, y, x + cw, y + ch))
+    if not shaped:
+        return []
+
+    # Must have enough ink inside (handwriting/print, not empty table cell)
+    if ink_sat is None:
+        ink_sat = integral((bw > 0).view(np.uint8))
+    ink = box_sums(ink_sat, shaped)
+    return [box for box, n in zip(shaped, ink)
+            if n / max((box[2] - box[0]) * (box[3] - box[1]), 1) > 0.03]  # at least 3% ink
+
+
+def _detect_by_components(bw, h, w, ink_sat=None):
+    """Find check rectangles from connected components: bounding boxes and
+    areas come from one connectedComponentsWithStats call (8-connected, as
+    findContours traces), the shape and ink filters of _detect_by_contours
+    run vectorized, and boxes nested inside another candidate are dropped."""
+    try:
+        # 16-bit labels halve the label-image traffic; OpenCV raises past 65535
+        _, _, stats, _ = cv2.connectedComponentsWithStats(bw, connectivity=8, ltype=cv2.CV_16U)
+    except cv2.error:
+        _, _, stats, _ = cv2.connectedComponentsWithStats(bw, connectivity=8, ltype=cv2.CV_32S)
+    x, y, cw, ch = (stats[1:, i].astype(np.int64) for i in range(4))
+    ar = cw / np.maximum(ch, 1)
+    shaped = ((cw >= int(w * 0.15)) & (ch >= int(h * 0.04)) & (ch <= int(h * 0.25))
+              & (cw * ch >= w * h * 0.005) & (ar > 1.2) & (ar < 7.0))
+    if not shaped.any():
+        return []
+    boxes = Boxes(np.stack([x, y, x + cw, y + ch], axis=1)[shaped])
+
+    # Must have enough ink inside (handwriting/print, not empty table cell)
+    if ink_sat is None:
+        ink_sat = integral((bw > 0).view(np.uint8))
+    boxes = boxes[box_sums(ink_sat, boxes) / np.maximum(boxes.areas, 1) > 0.03]
+    return boxes[drop_nested(boxes)].tolist()
+
+
+def _detect_by_line_grid(bw, gray, h, w, scale=1.0):
+    """Find check cells using horizontal/vertical line detection.
+    Pixel gaps are tuned at full resolution and scaled by `scale`."""
+    # Horizontal lines: ink per row in runs at least w/3 long
+    row_sums = _long_run_profile(bw, w // 3, axis=1)
     line_rows = np.where(row_sums > w * 0.20)[0]
-    h_lines = _cluster_positions(line_rows, min_gap=15)
+    h_lines = _cluster_positions(line_rows, min_gap=_px(15, scale))
 
     # Need enough horizontal lines to form a check grid
     if len(h_lines) < 5:
         return []
 
     # Find vertical centre split (line or white gap)
-    centre, two_col = _find_centre_split(bw, h, w)
+    centre, two_col = _find_centre_split(bw, h, w, scale)
 
     boundaries_y = sorted(set([0] + h_lines + [h]))
     min_cell_h = int(h * 0.03)
@@ -371,14 +942,12 @@ def _detect_by_line_grid(bw, gray, h, w):
     return merged
 
 
-def _find_centre_split(bw, h, w):
+def _find_centre_split(bw, h, w, scale=1.0):
     """Find vertical centre: line or white gap."""
-    # Method 1: vertical line
-    vert_k = cv2.getStructuringElement(cv2.MORPH_RECT, (1, h // 4))
-    vert = cv2.morphologyEx(bw, cv2.MORPH_OPEN, vert_k, iterations=1)
-    col_sums = np.sum(vert, axis=0) / 255
+    # Method 1: vertical line (ink per column in runs at least h/4 long)
+    col_sums = _long_run_profile(bw, h // 4, axis=0)
     vert_cols = np.where(col_sums > h * 0.15)[0]
-    v_lines = _cluster_positions(vert_cols, min_gap=20)
+    v_lines = _cluster_positions(vert_cols, min_gap=_px(20, scale))
     centre_lines = [v for v in v_lines if w * 0.35 < v < w * 0.65]
     if centre_lines:
         return min(centre_lines, key=lambda v: abs(v - w // 2)), True
@@ -389,70 +958,84 @@ def _find_centre_split(bw, h, w):
     mid_ink = ink_per_col[mid_s:mid_e]
     avg_ink = np.mean(ink_per_col)
     gap_cols = np.where(mid_ink < avg_ink * 0.15)[0] + mid_s
-    if len(gap_cols) >= 10:
+    if len(gap_cols) >= _px(10, scale):
         return int(np.mean(gap_cols)), True
 
     return None, False
 
 
+def _long_run_profile(bw, length, axis):
+    """Ink pixels per row (axis=1) or column (axis=0) left by a morphological
+    opening with a 1×length line, computed from run lengths instead of a
+    page-sized erode/dilate: only runs at least `length` long survive. Exact
+    against cv2.morphologyEx(MORPH_OPEN), including its anchor (an even
+    length shifts a run by one pixel) and border rule (outside counts as ink
+    while eroding, so runs touching an edge survive shorter)."""
+    ink = (bw > 0).view(np.int8)
+    if axis == 0:
+        ink = ink.T  # columns become rows
+    n_lines, n = ink.shape
+    pad = np.zeros((n_lines, 1), np.int8)
+    edges = np.diff(np.concatenate([pad, ink, pad], axis=1), axis=1)
+    # nonzero() walks row-major, so the k-th start and k-th end are one run
+    line, p = np.nonzero(edges == 1)
+    _, q = np.nonzero(edges == -1)
+    q -= 1  # inclusive run end
+
+    # Erosion keeps y when the window [y - a, y - a + length - 1] holds only
+    # run pixels (or falls outside the image); dilation then re-covers every
+    # x whose window reaches a kept y
+    a = length // 2
+    e_lo = np.where(p == 0, 0, p + a)
+    e_hi = np.where(q == n - 1, n - 1, q - length + 1 + a)
+    e_lo, e_hi = np.maximum(e_lo, 0), np.minimum(e_hi, n - 1)
+    d_lo = np.maximum(e_lo - length + 1 + a, 0)
+    d_hi = np.minimum(e_hi + a, n - 1)
+    kept = np.where(e_lo <= e_hi, d_hi - d_lo + 1, 0)
+    return np.bincount(line, weights=kept, minlength=n_lines)
+
+
 def _merge_small_cells(cells, min_h):
-    """Merge vertically-adjacent cells in same column until >= min_h."""
+    """Merge vertically-adjacent cells in same column until >= min_h.
+    Cells of a column must tile it top to bottom (as grid rows do), so each
+    merged cell ends at the first row end reaching y_start + min_h."""
     if not cells:
         return cells
-    cols = defaultdict(list)
-    for (x1, y1, x2, y2) in cells:
-        cols[(x1, x2)].append((y1, y2))
+    arr = np.asarray(cells, dtype=np.int64)
+    _, first_seen, col_id = np.unique(arr[:, [0, 2]], axis=0, return_index=True, return_inverse=True)
     merged = []
-    for (x1, x2), rows in cols.items():
-        rows.sort()
-        i = 0
-        while i < len(rows):
-            y_start, y_end = rows[i]
-            while y_end - y_start < min_h and i + 1 < len(rows):
-                i += 1
-                y_end = rows[i][1]
-            merged.append((x1, y_start, x2, y_end))
-            i += 1
+    for c in np.argsort(first_seen, kind="stable"):  # columns in order of appearance
+        col = arr[col_id.ravel() == c]
+        col = col[np.lexsort((col[:, 3], col[:, 1]))]
+        y1s, y2s = col[:, 1], col[:, 3]
+        x1, x2 = int(col[0, 0]), int(col[0, 2])
+        i, n = 0, len(col)
+        while i < n:
+            j = min(n - 1, i + int(np.searchsorted(y2s[i:], y1s[i] + min_h)))
+            merged.append((x1, int(y1s[i]), x2, int(y2s[j])))
+            i = j + 1
     return merged
 
 
 def _cluster_positions(positions, min_gap=10):
+    """Centres of runs of sorted positions separated by gaps > min_gap."""
+    positions = np.asarray(positions)
     if len(positions) == 0:
         return []
-    clusters = []
-    start = prev = positions[0]
-    for p in positions[1:]:
-        if p - prev > min_gap:
-            clusters.append(int((start + prev) / 2))
-            start = p
-        prev = p
-    clusters.append(int((start + prev) / 2))
-    return clusters
+    breaks = np.flatnonzero(np.diff(positions) > min_gap)
+    starts = positions[np.concatenate(([0], breaks + 1))]
+    ends = positions[np.concatenate((breaks, [len(positions) - 1]))]
+    return ((starts + ends) // 2).astype(int).tolist()
 
 
 def _deduplicate_boxes(boxes):
-    """Remove overlapping boxes, keeping the largest."""
+    """Remove overlapping boxes, keeping the largest (largest first)."""
     if not boxes:
         return boxes
-    boxes.sort(key=lambda r: (r[2] - r[0]) * (r[3] - r[1]), reverse=True)
-    kept = []
-    for r in boxes:
-        overlap = False
-        for f in kept:
-            ox1, oy1 = max(r[0], f[0]), max(r[1], f[1])
-            ox2, oy2 = min(r[2], f[2]), min(r[3], f[3])
-            if ox1 < ox2 and oy1 < oy2:
-                overlap_area = (ox2 - ox1) * (oy2 - oy1)
-                r_area = (r[2] - r[0]) * (r[3] - r[1])
-                if overlap_area > 0.35 * r_area:
-                    overlap = True
-                    break
-        if not overlap:
-            kept.append(r)
-    return kept
+    return [boxes[i] for i in suppress(boxes, 0.35)]
 
 
-def _expand_to_metadata(boxes, gray, page_h, page_w):
+def _expand_to_metadata(boxes, gray, page_h, page_w, scale=1.0):
     """Expand each check box DOWNWARD only to include metadata row below."""
     expanded = []
     for (x1, y1, x2, y2) in boxes:
@@ -461,19 +1044,165 @@ def _expand_to_metadata(boxes, gray, page_h, page_w):
         # Only look BELOW for metadata (check#, date, amount row)
         # Keep expansion modest — max 25% of box height
         search_below = min(int(box_h * 0.25), page_h - y2)
-        if search_below > 10:
+        if search_below > _px(10, scale):
             below_roi = gray[y2:y2 + search_below, x1:x2]
             if below_roi.size > 0 and np.mean(below_roi) < 250:
                 row_means = np.mean(below_roi, axis=1)
                 content_rows = np.where(row_means < 245)[0]
                 if len(content_rows) > 0:
-                    extend = content_rows[-1] + 5
+                    extend = content_rows[-1] + _px(5, scale)
                     y2 = min(y2 + extend, page_h)
 
         expanded.append((x1, y1, x2, y2))
     return expanded
 
 
+def _layout_signature(bw, scale=1.0):
+    """Cheap fingerprint of a page's ruled template: its shape and the
+    clustered positions of rows / columns that are mostly ink (long rules),
+    read from the projection profiles. Text and handwriting stay well below
+    the 40% fill, so pages of one template share a signature."""
+    h, w = bw.shape[:2]
+    rows = cv2.reduce(bw, 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel()
+    cols = cv2.reduce(bw, 0, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel()
+    h_rules = _cluster_positions(np.flatnonzero(rows > 255 * 0.40 * w), min_gap=_px(15, scale))
+    v_rules = _cluster_positions(np.flatnonzero(cols > 255 * 0.40 * h), min_gap=_px(20, scale))
+    return (h, w), h_rules, v_rules, _px(8, scale)
+
+
+def _same_layout(a, b):
+    """True if two layout signatures have the same rules, each within tolerance."""
+    (shape_a, rows_a, cols_a, tol), (shape_b, rows_b, cols_b, _) = a, b
+    if shape_a != shape_b or len(rows_a) != len(rows_b) or len(cols_a) != len(cols_b):
+        return False
+    return all(abs(p - q) <= tol for p, q in zip(rows_a + cols_a, rows_b + cols_b))
+
+
+class LayoutMemo:
+    """Line-grid cells of recently seen page templates within one job,
+    keyed by layout signature. Thread-safe; hits/misses count lookups."""
+
+    def __init__(self, size=DETECT_LAYOUT_MEMO):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._entries = []  # (signature, cells), most recent first
+        self._lock = threading.Lock()
+
+    def lookup(self, signature):
+        """Cells of a remembered layout matching `signature`, else None."""
+        with self._lock:
+            for i, (sig, cells) in enumerate(self._entries):
+                if _same_layout(sig, signature):
+                    self._entries.insert(0, self._entries.pop(i))
+                    self.hits += 1
+                    return cells
+            self.misses += 1
+            return None
+
+    def remember(self, signature, cells):
+        """Keep a freshly detected grid. Only pages whose signature itself
+        shows the grid's rules are kept, so a ruling-less page never hides a
+        fainter grid on a later one."""
+        if not cells or len(signature[1]) < DETECT_LAYOUT_MIN_RULES:
+            return
+        with self._lock:
+            self._entries.insert(0, (signature, cells))
+            del self._entries[self.size:]
+
+    def entries(self):
+        """Remembered (signature, cells) pairs, most recent first."""
+        with self._lock:
+            return list(self._entries)
+
+    def preload(self, entries):
+        """Remember layouts from an earlier job (e.g. read from a LayoutStore)."""
+        for signature, cells in reversed(list(entries)):
+            self.remember(signature, cells)
+
+
+def _signature_from_json(sig):
+    """Layout signature back from its JSON form (lists instead of tuples)."""
+    (h, w), rows, cols, tol = sig
+    return (int(h), int(w)), [int(p) for p in rows], [int(p) for p in cols], int(tol)
+
+
+def detect_worker_count(page_total, workers=None):
+    """Processes for detecting `page_total` pages: an explicit `workers` capped
+    at the page count, else CPU count with >= DETECT_MIN_PAGES_PER_WORKER each."""
+    if page_total <= 1:
+        return 1
+    if workers:
+        return max(1, min(int(workers), page_total))
+    by_pages = -(-page_total // DETECT_MIN_PAGES_PER_WORKER)
+    return max(1, min(os.cpu_count() or 1, by_pages))
+
+
+_worker_layouts = {}  # in pool workers: shared-memory block name -> LayoutMemo
+
+
+def _detect_shared(args):
+    """Process-pool entry point: detect one page whose gray plane lives in a
+    shared-memory block. Returns only the box list and the pre-OCR gate's
+    drop counts. With layout reuse each worker keeps a LayoutMemo for the
+    block (one job) it is working on."""
+    shm_name, offset, shape, format_hint, scale, method, layout_reuse, gate_steps, dpi_ratio = args
+    gate = PreOcrGate(gate_steps)
+    layouts = None
+    if layout_reuse:
+        layouts = _worker_layouts.get(shm_name)
+        if layouts is None:
+            _worker_layouts.clear()
+            layouts = _worker_layouts[shm_name] = LayoutMemo()
+    # Workers share the parent's resource tracker; the parent unlinks the block
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        gray = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=offset)
+        boxes = detect_checks_on_page(gray, format_hint=format_hint, scale=scale, method=method,
+                                      layouts=layouts, gate=gate, dpi_ratio=dpi_ratio)
+        del gray
+        return [tuple(int(v) for v in b) for b in boxes], dict(gate.skipped)
+    finally:
+        shm.close()
+
+
+def detect_pages_in_processes(pages, format_hint=None, scale=None, workers=None, method=None,
+                              layout_reuse=None, gate=None, dpi_ratios=None):
+    """detect_checks_on_page for each page, in a process pool. The pages' gray
+    planes are copied once into one shared-memory block; workers map it
+    instead of receiving pickled pages. Returns box lists in page order.
+    layout_reuse: each worker reuses grid layouts across the pages it gets
+    (defaults to DETECT_LAYOUT_REUSE). gate: optional PreOcrGate whose steps
+    run in the workers; their drop counts are added to it. dpi_ratios: per
+    page, see detect_checks_on_page."""
+    layout_reuse = DETECT_LAYOUT_REUSE if layout_reuse is None else bool(layout_reuse)
+    scale = DETECT_SCALE if scale is None else scale
+    grays = [_page_gray(p) for p in pages]
+    offsets, total = [], 0
+    for g in grays:
+        offsets.append(total)
+        total += g.nbytes
+    shm = shared_memory.SharedMemory(create=True, size=max(1, total))
+    try:
+        for g, off in zip(grays, offsets):
+            np.ndarray(g.shape, dtype=np.uint8, buffer=shm.buf, offset=off)[:] = g
+        del grays
+        gate_steps = gate.steps if gate else ()
+        dpi_ratios = dpi_ratios or [1.0] * len(pages)
+        tasks = [(shm.name, off, _page_gray(p).shape, format_hint, scale, method, layout_reuse, gate_steps, r)
+                 for p, off, r in zip(pages, offsets, dpi_ratios)]
+        n = detect_worker_count(len(pages), workers)
+        with ProcessPoolExecutor(max_workers=n) as pool:
+            results = list(pool.map(_detect_shared, tasks))
+        if gate:
+            for _, skipped in results:
+                gate.count(skipped)
+        return [boxes for boxes, _ in results]
+    finally:
+        shm.close()
+        shm.unlink()
+
+
 # ═════════════════════════════════════════════════════════════════════
 #  EMPTY FIELD TEMPLATE
 # ═════════════════════════════════════════════════════════════════════
@@ -492,11 +1221,10 @@ def _empty_fields():
 # ═════════════════════════════════════════════════════════════════════
 
 def extract_with_tesseract(img_path):
-    """Run Tesseract OCR on an image file."""
+    """Run Tesseract OCR on an image file (or a CropImage in memory)."""
     t0 = time.time()
     try:
-        img = cv2.imread(img_path)
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        gray = _crop_gray(img_path)
         gray = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
         text = pytesseract.image_to_string(gray)
         fields = _parse_check_text(text)
@@ -597,7 +1325,7 @@ def extract_with_numarkdown(img_path):
     try:
         client = _get_numarkdown_client()
         result = client.predict(
-            image=handle_file(img_path),
+            image=handle_file(os.fspath(img_path)),
             temperature=0.4,
             api_name="/query_vllm_api"
         )
@@ -688,6 +1416,22 @@ Return ONLY a JSON object with these exact keys:
 
 Important: For the payee field, read the HANDWRITTEN name carefully. It is the name written after "PAY TO THE ORDER OF". Do NOT return "THE ORDER OF" as the payee."""
 
+# Used when the check number, date and amount already came from the PDF text layer
+GEMINI_HANDWRITTEN_PROMPT = """Analyze this bank check image carefully. Pay special attention to HANDWRITTEN text.
+
+Return ONLY a JSON object with these exact keys:
+{
+  "payee": "full name of person/company the check is made out to (handwritten on PAY TO line)",
+  "amountWritten": "the amount written in words (e.g. Twelve hundred)",
+  "bankName": "name of the bank",
+  "memo": "memo line text if any, null otherwise",
+  "micr_routing": "9-digit routing number from MICR line at bottom",
+  "micr_account": "account number from MICR line",
+  "micr_serial": "serial/check number from MICR line"
+}
+
+Important: For the payee field, read the HANDWRITTEN name carefully. It is the name written after "PAY TO THE ORDER OF". Do NOT return "THE ORDER OF" as the payee."""
+
 
 def _next_gemini_key():
     global _gemini_key_idx
@@ -696,7 +1440,7 @@ def _next_gemini_key():
     return key
 
 
-def extract_with_openai(img_path):
+def extract_with_openai(img_path, prompt=GEMINI_PROMPT):
     """Call OpenAI GPT-4 Vision API with image as backup to Gemini."""
     t0 = time.time()
     if not OPENAI_AVAILABLE or not OPENAI_API_KEY:
@@ -706,8 +1450,7 @@ def extract_with_openai(img_path):
     try:
         client = OpenAI(api_key=OPENAI_API_KEY)
         
-        with open(img_path, "rb") as f:
-            img_b64 = base64.b64encode(f.read()).decode("utf-8")
+        img_b64 = base64.b64encode(_crop_bytes(img_path)).decode("utf-8")
         
         response = client.chat.completions.create(
             model="gpt-4o",
@@ -717,12 +1460,12 @@ def extract_with_openai(img_path):
                     "content": [
                         {
                             "type": "text",
-                            "text": GEMINI_PROMPT
+                            "text": prompt
                         },
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/png;base64,{img_b64}"
+                                "url": f"data:{image_mime(img_path)};base64,{img_b64}"
                             }
                         }
                     ]
@@ -781,20 +1524,20 @@ def extract_with_openai(img_path):
                 "fields": _empty_fields(), "processing_time_ms": int((time.time() - t0) * 1000)}
 
 
-def extract_with_gemini(img_path, key=None):
+def extract_with_gemini(img_path, key=None, prompt=GEMINI_PROMPT):
     """Call Gemini Flash 2.0 API with image. Tries all keys, then falls back to OpenAI.
     
     If `key` is provided it is used first (pinned-worker mode), otherwise round-robin.
+    `prompt` may be narrowed (GEMINI_HANDWRITTEN_PROMPT) when printed fields are pre-filled.
     """
     t0 = time.time()
-    with open(img_path, "rb") as f:
-        img_b64 = base64.b64encode(f.read()).decode("utf-8")
+    img_b64 = base64.b64encode(_crop_bytes(img_path)).decode("utf-8")
 
     payload = {
         "contents": [{
             "parts": [
-                {"inline_data": {"mime_type": "image/png", "data": img_b64}},
-                {"text": GEMINI_PROMPT}
+                {"inline_data": {"mime_type": image_mime(img_path), "data": img_b64}},
+                {"text": prompt}
             ]
         }],
         "generationConfig": {"temperature": 0.1, "maxOutputTokens": 1024}
@@ -884,7 +1627,7 @@ def extract_with_gemini(img_path, key=None):
     # Fall back to OpenAI if Gemini fails
     if OPENAI_API_KEY and OPENAI_AVAILABLE:
         print("    Falling back to OpenAI...")
-        openai_result = extract_with_openai(img_path)
+        openai_result = extract_with_openai(img_path, prompt)
         if not openai_result.get("error"):
             # Mark as gemini source but note it was OpenAI backup
             openai_result["source"] = "gemini-openai-backup"
@@ -896,6 +1639,68 @@ def extract_with_gemini(img_path, key=None):
             "fields": _empty_fields(), "processing_time_ms": int((time.time() - t0) * 1000)}
 
 
+# ═════════════════════════════════════════════════════════════════════
+#  PDF TEXT LAYER (digitally generated statements)
+# ═════════════════════════════════════════════════════════════════════
+
+_BBOX_PAGE_RE = re.compile(r'<page width="([\d.]+)" height="([\d.]+)">')
+_BBOX_WORD_RE = re.compile(
+    r'<word xMin="([\d.]+)" yMin="([\d.]+)" xMax="([\d.]+)" yMax="([\d.]+)">(.*?)</word>')
+
+
+def pdf_text_words(pdf_path, first_page=1, last_page=None):
+    """Word boxes from the PDF text layer via `pdftotext -bbox`.
+    Returns {page_num: (page_w_pt, page_h_pt, [(x1, y1, x2, y2, word), ...])}."""
+    cmd = [_poppler_bin("pdftotext"), "-bbox", "-f", str(first_page)]
+    if last_page:
+        cmd += ["-l", str(last_page)]
+    out = subprocess.run(cmd + [pdf_path, "-"], capture_output=True, text=True,
+                         timeout=120, check=True).stdout
+    pages, page_num, current = {}, first_page - 1, None
+    for line in out.splitlines():
+        m = _BBOX_PAGE_RE.search(line)
+        if m:
+            page_num += 1
+            current = (float(m.group(1)), float(m.group(2)), [])
+            pages[page_num] = current
+            continue
+        m = _BBOX_WORD_RE.search(line)
+        if m and current:
+            x1, y1, x2, y2 = (float(v) for v in m.groups()[:4])
+            current[2].append((x1, y1, x2, y2, html.unescape(m.group(5))))
+    return pages
+
+
+def _words_to_text(words):
+    """Join word boxes into reading-order lines."""
+    words = sorted(words, key=lambda w: (round(w[1] / 4), w[0]))
+    lines, last_row = [], None
+    for x1, y1, x2, y2, word in words:
+        row = round(y1 / 4)
+        if row != last_row:
+            lines.append([])
+            last_row = row
+        lines[-1].append(word)
+    return "\n".join(" ".join(l) for l in lines)
+
+
+def _parse_text_layer(text):
+    """Printed check number / date / amount from statement text. Stricter than
+    _parse_check_text: no bare-number fallbacks, amounts need cents."""
+    fields = {}
+    m = re.search(r'(?:Check|Chk|Serial)\s*(?:Number|No\.?|#)?\s*:?\s*#?\s*(\d{3,10})\b', text, re.I)
+    if m:
+        fields["checkNumber"] = m.group(1)
+    m = re.search(r'\b(\d{1,2}/\d{1,2}/\d{2,4})\b', text)
+    if m:
+        fields["checkDate"] = m.group(1)
+    m = (re.search(r'Amount\s*:?\s*\$?\s*([\d,]+\.\d{2})\b', text, re.I)
+         or re.search(r'\$\s*([\d,]+\.\d{2})\b', text))
+    if m:
+        fields["amount"] = m.group(1).replace(",", "")
+    return fields
+
+
 # ═════════════════════════════════════════════════════════════════════
 #  HYBRID MERGE (3 engines)
 # ═════════════════════════════════════════════════════════════════════
@@ -1004,132 +1809,931 @@ def merge_all(tess, numd, gemini):
     return merged
 
 
+# ═════════════════════════════════════════════════════════════════════
+#  PDF RASTERIZATION (Poppler)
+# ═════════════════════════════════════════════════════════════════════
+
+_poppler_dir = None  # resolved once: "" means use system PATH
+
+
+def _poppler_path():
+    """Locate a bundled Windows Poppler, or None to use the system PATH."""
+    global _poppler_dir
+    if _poppler_dir is not None:
+        return _poppler_dir or None
+
+    _script_dir = os.path.dirname(os.path.abspath(__file__))
+    _poppler_dir = ""
+
+    # Try local Windows poppler installation first, then a cwd-based path
+    for base in (_script_dir, os.getcwd()):
+        local_poppler = os.path.join(base, "poppler", "poppler-23.11.0", "Library", "bin")
+        if os.path.isdir(local_poppler):
+            _poppler_dir = local_poppler
+            print(f"  Using local Poppler: {local_poppler}")
+            break
+    else:
+        # In Docker/Linux, poppler-utils is in system PATH, so don't specify path
+        print(f"  Using system Poppler (from PATH)")
+    return _poppler_dir or None
+
+
+def pdf_page_count(pdf_path):
+    """Read the page count from PDF metadata without rendering anything."""
+    kwargs = {}
+    if _poppler_path():
+        kwargs["poppler_path"] = _poppler_path()
+    return int(pdfinfo_from_path(pdf_path, **kwargs).get("Pages", 0))
+
+
+def _poppler_bin(name):
+    path = _poppler_path()
+    return os.path.join(path, name) if path else name
+
+
+def raster_worker_count(page_total, workers=None):
+    """Number of pdftoppm processes to shard `page_total` pages over. An explicit
+    `workers` is capped at the page count; 0/None auto-sizes from the CPU
+    count so that each process renders at least RASTER_MIN_SHARD_PAGES."""
+    if page_total <= 1:
+        return 1
+    if workers:
+        return max(1, min(int(workers), page_total))
+    by_pages = -(-page_total // RASTER_MIN_SHARD_PAGES)
+    return max(1, min(os.cpu_count() or 1, by_pages))
+
+
+def render_pdf_pages(pdf_path, dpi=RASTER_DPI, first_page=None, last_page=None, grayscale=False,
+                     workers=1):
+    """Rasterize a 1-based inclusive page range (whole document if omitted).
+    workers > 1 splits the range into contiguous shards, each rendered by
+    its own pdftoppm process (pdf2image thread_count): no Python worker
+    processes are forked and pages are not pickled between processes.
+    Pages are returned in document order either way."""
+    kwargs = {"dpi": dpi, "grayscale": grayscale}
+    if workers > 1:
+        kwargs["thread_count"] = int(workers)
+    if first_page:
+        kwargs["first_page"] = first_page
+    if last_page:
+        kwargs["last_page"] = last_page
+    if _poppler_path():
+        kwargs["poppler_path"] = _poppler_path()
+    return convert_from_path(pdf_path, **kwargs)
+
+
+def _pdfinfo_pages(pdf_path):
+    """Raw `pdfinfo` output including per-page size/rotation lines."""
+    return subprocess.run([_poppler_bin("pdfinfo"), "-f", "1", "-l", "1000000", pdf_path],
+                          capture_output=True, text=True, timeout=60, check=True).stdout
+
+
+def pdf_page_geometry(pdf_path, pdfinfo_out=None):
+    """{page_num: (width_pt, height_pt, rotation)} for every page, from pdfinfo."""
+    out = pdfinfo_out if pdfinfo_out is not None else _pdfinfo_pages(pdf_path)
+    geo = {}
+    for line in out.splitlines():
+        m = re.match(r"Page\s+(\d+)\s+size:\s+([\d.]+) x ([\d.]+)", line)
+        if m:
+            geo[int(m.group(1))] = (float(m.group(2)), float(m.group(3)), 0)
+            continue
+        m = re.match(r"Page\s+(\d+)\s+rot:\s+(\d+)", line)
+        if m and int(m.group(1)) in geo:
+            w_pt, h_pt, _ = geo[int(m.group(1))]
+            geo[int(m.group(1))] = (w_pt, h_pt, int(m.group(2)))
+    return geo
+
+
+def pdf_image_list(pdf_path):
+    """{page_num: [image info]} from `pdfimages -list` (metadata only, no decoding)."""
+    out = subprocess.run([_poppler_bin("pdfimages"), "-list", pdf_path],
+                         capture_output=True, text=True, timeout=60).stdout
+    images = defaultdict(list)
+    for line in out.splitlines()[2:]:
+        f = line.split()
+        # page num type width height color comp bpc enc interp object ID x-ppi y-ppi size ratio
+        # (inline images print a single "[inline]" token for "object ID")
+        if len(f) < 15 or not f[0].isdigit():
+            continue
+        try:
+            images[int(f[0])].append({
+                "type": f[2], "width": int(f[3]), "height": int(f[4]),
+                "color": f[5], "bpc": int(f[7]), "enc": f[8],
+                "x_ppi": float(f[-4]), "y_ppi": float(f[-3]),
+            })
+        except ValueError:
+            continue
+    return dict(images)
+
+
+def _full_page_scan(images, geometry):
+    """The page's only image if it is a single unrotated bitmap covering the
+    whole page (a wrapped scan), else None."""
+    if len(images) != 1 or not geometry:
+        return None
+    im = images[0]
+    w_pt, h_pt, rot = geometry
+    if im["type"] != "image" or rot % 360 or im["x_ppi"] <= 0 or im["y_ppi"] <= 0:
+        return None
+    cover_w = im["width"] / im["x_ppi"] * 72
+    cover_h = im["height"] / im["y_ppi"] * 72
+    if abs(cover_w - w_pt) > 0.02 * w_pt or abs(cover_h - h_pt) > 0.02 * h_pt:
+        return None
+    return im
+
+
+def pdf_preflight(pdf_path, dpi=RASTER_DPI):
+    """Plan a document from metadata alone (pdfinfo + pdfimages -list, no
+    rendering): page count, page sizes and whether each page is a wrapped
+    scan, vector/text only, or mixed. Raises on files Poppler cannot read."""
+    t0 = time.time()
+    out = _pdfinfo_pages(pdf_path)
+    m = re.search(r"^Pages:\s+(\d+)", out, re.M)
+    page_count = int(m.group(1)) if m else 0
+    geometry = pdf_page_geometry(pdf_path, out)
+    try:
+        images = pdf_image_list(pdf_path)
+    except Exception as e:
+        print(f"  Preflight: image list unavailable ({e})")
+        images = {}
+
+    pages, kinds = [], defaultdict(int)
+    for page_num in range(1, page_count + 1):
+        w_pt, h_pt, rot = geometry.get(page_num, (0.0, 0.0, 0))
+        page_images = images.get(page_num, [])
+        scan = _full_page_scan(page_images, geometry.get(page_num))
+        kind = "scan" if scan else "mixed" if page_images else "vector"
+        kinds[kind] += 1
+        pages.append({
+            "page": page_num, "width_pt": w_pt, "height_pt": h_pt, "rotation": rot,
+            "images": len(page_images), "kind": kind, "scan": scan,
+        })
+
+    page_mp = [p["width_pt"] * p["height_pt"] * (dpi / 72) ** 2 / 1e6 for p in pages]
+    return {
+        "page_count": page_count,
+        "encrypted": bool(re.search(r"^Encrypted:\s+yes", out, re.M)),
+        "scan_pages": kinds["scan"],
+        "vector_pages": kinds["vector"],
+        "mixed_pages": kinds["mixed"],
+        "dpi": dpi,
+        "max_page_megapixels": round(max(page_mp, default=0), 1),
+        "total_megapixels": round(sum(page_mp), 1),
+        "elapsed_ms": int((time.time() - t0) * 1000),
+        "pages": pages,
+    }
+
+
+def preflight_problems(info):
+    """Reasons to reject a document before rendering (empty list = OK)."""
+    problems = []
+    if not info["page_count"]:
+        problems.append("PDF has no pages")
+    if info["page_count"] > PREFLIGHT_MAX_PAGES:
+        problems.append(f"{info['page_count']} pages (max {PREFLIGHT_MAX_PAGES})")
+    if info["max_page_megapixels"] > PREFLIGHT_MAX_PAGE_MP:
+        problems.append(f"page of {info['max_page_megapixels']:.0f} MP at {info['dpi']} DPI "
+                        f"(max {PREFLIGHT_MAX_PAGE_MP:.0f})")
+    busiest = max(info["pages"], key=lambda p: p["images"], default=None)
+    if busiest and busiest["images"] > PREFLIGHT_MAX_PAGE_IMAGES:
+        problems.append(f"page {busiest['page']} has {busiest['images']} images "
+                        f"(max {PREFLIGHT_MAX_PAGE_IMAGES})")
+    return problems
+
+
+def extract_embedded_page_image(pdf_path, page_num):
+    """Pull a page's embedded bitmap at native resolution (JPEG passed through
+    as-is, other encodings decoded losslessly). Returns a PIL image, or None
+    if extraction fails or the result looks unusable."""
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            subprocess.run([_poppler_bin("pdfimages"), "-f", str(page_num), "-l", str(page_num),
+                            "-j", "-png", pdf_path, os.path.join(tmp, "img")],
+                           capture_output=True, timeout=60, check=True)
+            files = sorted(os.listdir(tmp))
+            if len(files) != 1:
+                return None
+            img = Image.open(os.path.join(tmp, files[0]))
+            img.load()
+        except Exception as e:
+            print(f"  Embedded image extraction failed (page {page_num}): {e}")
+            return None
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("L" if img.mode in ("1", "LA", "I", "I;16") else "RGB")
+    # /Decode arrays are not applied by pdfimages: a mostly-dark "page" is
+    # probably an inverted bilevel scan, so leave it to the renderer
+    if np.mean(np.asarray(img.convert("L").reduce(8))) < 100:
+        return None
+    return img
+
+
+def render_pdf_region(pdf_path, page_num, box, dpi=RASTER_DPI, grayscale=False):
+    """Render only box=(x1, y1, x2, y2), in pixels at `dpi`, of a 1-based page.
+    Uses pdftoppm's cropped rendering. Returns a PIL image, or None on failure."""
+    x1, y1, x2, y2 = (int(v) for v in box)
+    cmd = [_poppler_bin("pdftoppm"), "-r", str(dpi),
+           "-f", str(page_num), "-l", str(page_num),
+           "-x", str(x1), "-y", str(y1), "-W", str(x2 - x1), "-H", str(y2 - y1)]
+    if grayscale:
+        cmd.append("-gray")
+    cmd.append(pdf_path)
+    try:
+        out = subprocess.run(cmd, capture_output=True, timeout=60, check=True).stdout
+        img = Image.open(BytesIO(out))
+        img.load()
+        return img
+    except Exception as e:
+        print(f"  Region render failed (page {page_num}, box {box}): {e}")
+        return None
+
+
 # ═════════════════════════════════════════════════════════════════════
 #  MAIN APP
 # ═════════════════════════════════════════════════════════════════════
 
+def _link_file(src, dst):
+    """Make dst the same file as src: a hard link, else a byte copy
+    (filesystems without links). Replaces an existing dst."""
+    try:
+        if os.path.lexists(dst):
+            os.remove(dst)
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def _same_check_number(known, record):
+    """True if a check's text-layer check number equals the one in an indexed
+    extraction (both present, leading zeros ignored)."""
+    ours = str((known or {}).get("checkNumber") or "").lstrip("0")
+    field = (record.get("extraction") or {}).get("checkNumber")
+    theirs = str((field.get("value") if isinstance(field, dict) else field) or "").lstrip("0")
+    return bool(ours) and ours == theirs
+
+
 class CheckExtractorApp:
-    def __init__(self, pdf_path, output_dir="extracted_checks"):
+    def __init__(self, pdf_path, output_dir="extracted_checks", stream=None, page_budget=None,
+                 grayscale=None, raster_workers=None, detect_dpi=None, page_cache=None,
+                 embedded_images=None, text_layer=None, preflight=None, page_range=None,
+                 first_check_number=None, doc_format=None, detect_scale=None,
+                 detect_processes=None, detect_workers=None, detect_method=None,
+                 layout_reuse=None, layout_store=None, pre_ocr_gate=None, crop_index=None,
+                 crop_profile=None, crop_handoff_mb=None):
+        """
+        stream: rasterize in windows of `page_budget` pages instead of holding
+          the whole document in self.pages (defaults to STREAM_RASTER). In this
+          mode only doc_format/page_count are known after construction; pages
+          are detected and cropped as they arrive in extract_all_images().
+        page_budget: max pages alive at once in streaming mode.
+        grayscale: render pages as 8-bit gray for detection and re-render only
+          the final crops in colour (defaults to RASTER_GRAYSCALE).
+        raster_workers: Poppler processes to shard rendering over; 0 sizes
+          from CPU and page count (defaults to RASTER_WORKERS).
+        detect_dpi: two-pass mode. Pages are rendered and detected at this DPI,
+          boxes are scaled to `dpi` and each check is rendered on its own at
+          full DPI (defaults to RASTER_DETECT_DPI; 0 = single pass). page_boxes
+          and page_sizes are always in full-DPI pixels.
+        page_cache: optional page_cache.PageCache; rendered pages are read
+          from / written to it, keyed by PDF hash, render DPI and colour mode.
+        embedded_images: take image-only (scanned) pages from their embedded
+          bitmap at native resolution instead of rendering them (defaults to
+          RASTER_EMBEDDED_IMAGES). Such pages are listed in native_pages and
+          their boxes are in native pixels.
+        text_layer: pre-fill printed fields from the PDF text layer before
+          OCR (defaults to TEXT_LAYER_PREFILL).
+        preflight: result of pdf_preflight() for this file; supplies the page
+          count and scanned-page plan so pdfinfo/pdfimages are not re-run.
+        page_range: (first, last) 1-based inclusive pages to rasterize and
+          detect; others are never rendered. Page indexes stay document-wide.
+        first_check_number: number of the first check in page_range, so check
+          IDs match full-document numbering. If omitted with a range starting
+          after page 1, earlier pages are detected (not cropped) to count them.
+        doc_format: known predominant format ('A'/'B') of the document; when
+          omitted with a page_range, it is voted on the document's first pages
+          (not the range's) so detection matches a full-document run.
+        detect_scale: run the detector on pages downsampled by this factor;
+          boxes are mapped back to page pixels (defaults to DETECT_SCALE).
+        detect_processes: detect pages in a process pool over shared memory
+          (defaults to DETECT_PROCESSES); detect_workers caps its size
+          (0 = auto, defaults to DETECT_WORKERS).
+        detect_method: bordered-box finder for this document, "contours" or
+          "components" (defaults to DETECT_METHOD).
+        layout_reuse: reuse line-grid layouts between pages of this document
+          with the same ruling signature (defaults to DETECT_LAYOUT_REUSE);
+          self.layouts holds them and counts hits.
+        layout_store: optional layout_store.LayoutStore. When the document's
+          first pages match a stored template, format voting is skipped and
+          its grids are preloaded (known_template is set); otherwise the
+          voted format and detected grids are recorded after detection.
+        pre_ocr_gate: PRE_OCR_GATE_STEPS run on detected boxes so backs, blanks
+          and non-check cells are never cropped or sent to OCR (defaults to
+          PRE_OCR_GATE; () disables). self.gate.skipped counts them per step.
+        crop_index: optional crop_index.CropIndex. Crops with the same pixels
+          as one OCR'd before - in an earlier job or earlier in this one - (or,
+          from an earlier job, a dHash within its max_distance and the same
+          text-layer check number) reuse that extraction instead of running
+          the engines; their hybrid.json records it under "deduplicated".
+        crop_profile: how crops are encoded, a CROP_PROFILES name (defaults to
+          CROP_PROFILE).
+        crop_handoff_mb: MB of crop pixels kept in memory for Phase 2 (defaults
+          to CROP_HANDOFF_MB; 0 reads every crop back from disk). Crops are
+          written in the background; flush_crops() waits for the files.
+        """
         self.pdf_path = pdf_path
         self.output_dir = output_dir
+        self.stream = STREAM_RASTER if stream is None else bool(stream)
+        self.page_budget = max(1, int(page_budget or RASTER_PAGE_BUDGET))
+        self.grayscale = RASTER_GRAYSCALE if grayscale is None else bool(grayscale)
+        self.raster_workers = RASTER_WORKERS if raster_workers is None else max(0, int(raster_workers))
+        self.dpi = RASTER_DPI
+        self.detect_dpi = RASTER_DETECT_DPI if detect_dpi is None else max(0, int(detect_dpi))
+        self.detect_scale = DETECT_SCALE if detect_scale is None else min(1.0, max(0.1, float(detect_scale)))
+        self.detect_processes = DETECT_PROCESSES if detect_processes is None else bool(detect_processes)
+        self.detect_workers = DETECT_WORKERS if detect_workers is None else max(0, int(detect_workers))
+        self.detect_method = detect_method if detect_method in DETECT_METHODS else DETECT_METHOD
+        self.layout_reuse = DETECT_LAYOUT_REUSE if layout_reuse is None else bool(layout_reuse)
+        self.layouts = LayoutMemo() if self.layout_reuse else None
+        self.layout_store = layout_store
+        self.known_template = None  # layout store key when a stored template matched
+        self._template = None       # (key, signature) of this document's layout
+        self.gate = PreOcrGate(pre_ocr_gate)
+        self.crop_index = crop_index
+        self.crop_fingerprints = {}  # check_id -> crop_fingerprint(), filled while cropping
+        self.crop_profile = crop_profile if crop_profile in CROP_PROFILES else CROP_PROFILE
+        self.crop_handoff_bytes = (CROP_HANDOFF_MB if crop_handoff_mb is None else crop_handoff_mb) * 1024 * 1024
+        self.crop_images = {}        # check_id -> CropImage handed to the engines
+        self._crop_writes = {}       # check_id -> (CheckCrop, pending write future)
+        self._crop_writer = None
+        self._handoff_used = 0
         self.pages = []
         self.page_boxes = {}
+        self.page_sizes = {}  # page index -> (width, height), filled in both modes
+        self.page_count = 0
+        self.doc_format = doc_format
+        self.page_cache = page_cache
+        self.embedded_images = RASTER_EMBEDDED_IMAGES if embedded_images is None else bool(embedded_images)
+        self.native_pages = set()  # page indexes taken from embedded bitmaps
+        self._scan_pages = None    # {page_num: image info}, planned on first render
+        self.text_layer = TEXT_LAYER_PREFILL if text_layer is None else bool(text_layer)
+        self.check_boxes = {}      # check_id -> (page index, full-DPI box)
+        self.preflight = preflight
+        self.page_range = page_range
+        self.first_page = 1
+        self.last_page = 0
+        self.first_check_number = first_check_number
+        self._pdf_hash = None
+        self._pending_window = []  # first streaming window, rendered for format voting
 
         os.makedirs(f"{output_dir}/images", exist_ok=True)
 
         # Only convert PDF if path is provided (for re-extraction, we skip this)
         if pdf_path:
-            self.convert_pdf_to_images()
-            self.auto_detect_all()
-
-    def convert_pdf_to_images(self, dpi=300):
-        print(f"Converting PDF to images at {dpi} DPI...")
-        
-        # Determine poppler path based on environment
-        poppler_path = None
-        _script_dir = os.path.dirname(os.path.abspath(__file__))
-        
-        # Try local Windows poppler installation first
-        local_poppler = os.path.join(
-            _script_dir, "poppler", "poppler-23.11.0", "Library", "bin"
-        )
-        if os.path.isdir(local_poppler):
-            poppler_path = local_poppler
-            print(f"  Using local Poppler: {poppler_path}")
-        else:
-            # Fallback: try cwd-based path (for Windows)
-            cwd_poppler = os.path.join(
-                os.getcwd(), "poppler", "poppler-23.11.0", "Library", "bin"
-            )
-            if os.path.isdir(cwd_poppler):
-                poppler_path = cwd_poppler
-                print(f"  Using local Poppler: {poppler_path}")
+            if self.stream:
+                self.start_stream()
             else:
-                # In Docker/Linux, poppler-utils is in system PATH, so don't specify path
-                print(f"  Using system Poppler (from PATH)")
-        
-        # Only pass poppler_path if we found a local installation
-        if poppler_path:
-            self.pages = convert_from_path(self.pdf_path, dpi=dpi, poppler_path=poppler_path)
+                self.convert_pdf_to_images()
+                self.auto_detect_all()
+
+    @property
+    def render_dpi(self):
+        """DPI pages are rasterized at: detect_dpi in two-pass mode, else dpi."""
+        if self.detect_dpi and self.detect_dpi < self.dpi:
+            return self.detect_dpi
+        return self.dpi
+
+    @property
+    def box_scale(self):
+        """Factor from rendered-page pixels to full-DPI crop pixels."""
+        return self.dpi / self.render_dpi
+
+    def _page_scale(self, idx):
+        """box_scale for one page; embedded bitmaps are already full resolution."""
+        return 1 if idx in self.native_pages else self.box_scale
+
+    def _dpi_ratio(self, idx):
+        """A page's pixel density over `dpi`, which the detector's pixel
+        constants are scaled from: render_dpi / dpi for rendered pages, the
+        scan's own resolution for embedded bitmaps."""
+        if idx in self.native_pages:
+            scan = (self._scan_pages or {}).get(idx + 1)
+            return scan["x_ppi"] / self.dpi if scan else 1.0
+        return self.render_dpi / self.dpi
+
+    def _scale_boxes(self, boxes, s):
+        """Map boxes detected on a rendered page to full-DPI pixels."""
+        if s == 1:
+            return boxes
+        return [(int(x1 * s), int(y1 * s), math.ceil(x2 * s), math.ceil(y2 * s))
+                for (x1, y1, x2, y2) in boxes]
+
+    @property
+    def page_cache_key(self):
+        """Page-cache key for the current render settings (None without a cache)."""
+        if not self.page_cache or not self.pdf_path:
+            return None
+        if self._pdf_hash is None:
+            self._pdf_hash = file_sha256(self.pdf_path)
+        return self.page_cache.key(self._pdf_hash, self.render_dpi, self.grayscale)
+
+    def _pdf_page_count(self):
+        if self.preflight:
+            return self.preflight["page_count"]
+        return pdf_page_count(self.pdf_path)
+
+    def _set_page_range(self):
+        """Clamp page_range to the document; full document when unset."""
+        first, last = self.page_range or (1, self.page_count)
+        self.first_page = max(1, int(first or 1))
+        self.last_page = min(self.page_count, int(last or self.page_count))
+
+    def _vote_format(self, pages):
+        """Predominant format from the document's first pages. `pages` are used
+        when they start at page 1; a range elsewhere renders the sample."""
+        if self.doc_format:
+            return self.doc_format
+        if self.first_page > 1:
+            pages = self._render_range(1, min(3, self.page_count))
+        known = self._match_template(pages)
+        if known:
+            return known
+        return determine_predominant_format(pages, scale=self.detect_scale, method=self.detect_method,
+                                            layouts=self.layouts,
+                                            dpi_ratios=[self._dpi_ratio(i) for i in range(len(pages))])
+
+    def _match_template(self, pages, sample_count=3):
+        """Format of a stored template matching the first ruled sample page,
+        preloading its grids; None on a miss or without a layout store."""
+        if not self.layout_store:
+            return None
+        for i, page in enumerate(pages[:sample_count]):
+            prep = _page_prep(page, self.detect_scale, self.detect_method, self._dpi_ratio(i))
+            signature = _layout_signature(prep.bw, prep.px_scale)
+            if len(signature[1]) >= DETECT_LAYOUT_MIN_RULES:
+                break
         else:
-            self.pages = convert_from_path(self.pdf_path, dpi=dpi)
-        
+            return None
+        key = LayoutStore.key(signature)
+        self._template = (key, signature)
+        match = self._find_template(key, signature)
+        if not match:
+            return None
+        key, record = match
+        self._template = (key, signature)  # update the matched record, not a near-duplicate
+        if self.layouts is not None:
+            self.layouts.preload((_signature_from_json(sig), [tuple(c) for c in cells])
+                                 for sig, cells in record.get("layouts", []))
+        self.known_template = key
+        print(f"  Known layout template {key} (seen in {record.get('jobs', 1)} job(s))")
+        return record["format"]
+
+    def _find_template(self, key, signature):
+        """(key, record) of the stored template matching `signature`: the one
+        under its own key, else a same-size record whose rules fell into
+        neighbouring quantization buckets."""
+        def usable(record):
+            return (record and record.get("format") in ("A", "B")
+                    and record.get("method") == self.detect_method
+                    and _same_layout(_signature_from_json(record["signature"]), signature))
+
+        record = self.layout_store.get(key)
+        if usable(record):
+            return key, record
+        for other in self.layout_store.same_size(signature):
+            if other != key and usable(self.layout_store.get(other, touch=False)):
+                return other, self.layout_store.get(other)
+        return None
+
+    def _record_template(self):
+        """Store this document's format and grids under its layout key."""
+        if not self.layout_store or not self._template or not self.doc_format:
+            return
+        key, signature = self._template
+        layouts = self.layouts.entries() if self.layouts is not None else []
+        self.layout_store.put(key, {
+            "format": self.doc_format,
+            "method": self.detect_method,
+            "signature": signature,
+            "layouts": [[sig, cells] for sig, cells in layouts],
+        })
+
+    def _indexed_pages(self):
+        """(document page index, page) pairs for the pages held in self.pages."""
+        return list(enumerate(self.pages, self.first_page - 1))
+
+    def _plan_embedded_pages(self):
+        """Find pages that are a single full-page scan (metadata only)."""
+        if self.preflight:
+            self._scan_pages = {p["page"]: p["scan"] for p in self.preflight["pages"] if p["scan"]}
+            if self._scan_pages:
+                print(f"  {len(self._scan_pages)} image-only page(s) will use embedded bitmaps")
+            return
+        try:
+            geometry = pdf_page_geometry(self.pdf_path)
+            self._scan_pages = {
+                p: im for p, images in pdf_image_list(self.pdf_path).items()
+                if (im := _full_page_scan(images, geometry.get(p)))
+            }
+        except Exception as e:
+            print(f"  Embedded image scan failed ({e}), rendering all pages")
+            self._scan_pages = {}
+        if self._scan_pages:
+            print(f"  {len(self._scan_pages)} image-only page(s) will use embedded bitmaps")
+
+    def _render_range(self, first_page, last_page):
+        """Rasterize an inclusive 1-based page range into PageBuffers. Image-only
+        pages come from their embedded bitmap when enabled; the rest are
+        rendered in contiguous runs through the page cache."""
+        if not self.embedded_images:
+            return self._render_run(first_page, last_page)
+        if self._scan_pages is None:
+            self._plan_embedded_pages()
+
+        pages, run_start = [], None
+        for page_num in range(first_page, last_page + 2):
+            native = None
+            if page_num <= last_page and page_num in self._scan_pages:
+                native = extract_embedded_page_image(self.pdf_path, page_num)
+            if native is None and page_num <= last_page:
+                run_start = run_start or page_num
+                continue
+            if run_start:
+                pages.extend(self._render_run(run_start, page_num - 1))
+                run_start = None
+            if native is not None:
+                self.native_pages.add(page_num - 1)
+                pages.append(PageBuffer(native))
+        return pages
+
+    def _render_run(self, first_page, last_page):
+        """Render a contiguous page range, via the page cache if set."""
+        key = self.page_cache_key
+        if key:
+            arrays = self.page_cache.get_pages(key, first_page, last_page)
+            if arrays is not None:
+                print(f"  Page cache hit: pages {first_page}-{last_page}")
+                return [PageBuffer(a) for a in arrays]
+        workers = raster_worker_count(last_page - first_page + 1, self.raster_workers)
+        rendered = render_pdf_pages(self.pdf_path, dpi=self.render_dpi, grayscale=self.grayscale,
+                                    first_page=first_page, last_page=last_page, workers=workers)
+        pages = [PageBuffer(p) for p in rendered]
+        del rendered
+        if key:
+            self.page_cache.put_pages(key, first_page, [p.pixels for p in pages],
+                                      total_pages=self.page_count)
+        return pages
+
+    def convert_pdf_to_images(self, dpi=RASTER_DPI):
+        self.dpi = dpi
+        self.page_count = self._pdf_page_count()
+        self._set_page_range()
+        n = max(0, self.last_page - self.first_page + 1)
+        span = f" (pages {self.first_page}-{self.last_page})" if self.page_range else ""
+        print(f"Converting PDF to images at {self.render_dpi} DPI{' (grayscale)' if self.grayscale else ''}"
+              f"{span} with {raster_worker_count(n, self.raster_workers)} process(es)...")
+        self.pages = self._render_range(self.first_page, self.last_page) if n else []
+        self.last_page = self.first_page + len(self.pages) - 1
+        if not self.page_range:
+            self.page_count = len(self.pages)
         print(f"Converted {len(self.pages)} pages")
 
+    # ── Streaming rasterization ──────────────────────────────────────
+    def start_stream(self):
+        """Read the page count and render only the first window, which is
+        used for format voting and kept for extract_all_images()."""
+        self.page_count = self._pdf_page_count()
+        self._set_page_range()
+        print(f"Streaming pages {self.first_page}-{self.last_page} of {self.page_count} at "
+              f"{self.render_dpi} DPI ({self.page_budget} page(s) per window)...")
+        if self.last_page < self.first_page:
+            return
+        self._pending_window = self._render_window(self.first_page - 1)
+        self.doc_format = self._vote_format([p for _, p in self._pending_window])
+        if self.doc_format:
+            print(f"  Document format: {'Contour/Bordered' if self.doc_format == 'A' else 'Line-Grid'}")
+
+    def _render_window(self, start_idx):
+        """Render pages [start_idx, start_idx + page_budget) as (index, page) pairs."""
+        last = min(start_idx + self.page_budget, self.last_page)
+        return list(enumerate(self._render_range(start_idx + 1, last), start_idx))
+
+    def _iter_page_windows(self):
+        """Yield page windows in order; in streaming mode at most one window is
+        held here while the caller processes it."""
+        if not self.stream:
+            yield self._indexed_pages()
+            return
+        start = self.first_page - 1
+        if self._pending_window:
+            window, self._pending_window = self._pending_window, []
+            start = window[-1][0] + 1
+            yield window
+            del window
+        while start < self.last_page:
+            yield self._render_window(start)
+            start += self.page_budget
+
     def auto_detect_all(self):
         """Detect checks on all pages in parallel, using predominant format."""
         # Determine the predominant format from the first few pages
-        self.doc_format = determine_predominant_format(self.pages)
+        self.doc_format = self._vote_format(self.pages)
         if self.doc_format:
             print(f"  Document format: {'Contour/Bordered' if self.doc_format == 'A' else 'Line-Grid'}")
 
-        total = 0
+        if not self.pages:
+            print("  No pages to detect checks on")
+            return
+
+        total = self._detect_pages(self._indexed_pages())
+        print(f"Total auto-detected: {total} checks across {len(self.pages)} pages")
+        self._report_detection()
+        self._record_template()
+
+    def _detect_pages(self, indexed_pages):
+        """Run detection on (index, page) pairs in parallel; fills page_boxes."""
         fmt = self.doc_format
 
         def _detect(idx_page):
             idx, page = idx_page
-            boxes = detect_checks_on_page(page, format_hint=fmt)
+            ratio = self._dpi_ratio(idx)
+            boxes = detect_checks_on_page(page, format_hint=fmt, scale=self.detect_scale,
+                                          method=self.detect_method, layouts=self.layouts,
+                                          gate=self.gate, dpi_ratio=ratio)
+            if isinstance(page, PageBuffer):
+                page.prep(self.detect_scale, self.detect_method, ratio).drop_planes()  # keep candidates, free planes
             return idx, boxes
 
-        if not self.pages:
-            print("  No pages to detect checks on")
-            return
-
-        with ThreadPoolExecutor(max_workers=min(8, max(1, len(self.pages)))) as pool:
-            results = pool.map(_detect, enumerate(self.pages))
+        results = None
+        if self.detect_processes and detect_worker_count(len(indexed_pages), self.detect_workers) > 1:
+            try:
+                boxes = detect_pages_in_processes([p for _, p in indexed_pages], fmt,
+                                                  self.detect_scale, self.detect_workers,
+                                                  self.detect_method, self.layout_reuse,
+                                                  self.gate, [self._dpi_ratio(i) for i, _ in indexed_pages])
+                results = [(idx, b) for (idx, _), b in zip(indexed_pages, boxes)]
+            except Exception as e:
+                print(f"  Process-pool detection failed ({e}), using threads")
+        if results is None:
+            with ThreadPoolExecutor(max_workers=min(8, max(1, len(indexed_pages)))) as pool:
+                results = list(pool.map(_detect, indexed_pages))
 
-        for idx, boxes in sorted(results, key=lambda x: x[0]):
-            self.page_boxes[idx] = boxes
+        total = 0
+        for (idx, boxes), (_, page) in zip(results, indexed_pages):
+            s = self._page_scale(idx)
+            self.page_boxes[idx] = self._scale_boxes(boxes, s)
+            self.page_sizes[idx] = (round(page.width * s), round(page.height * s))
             if boxes:
                 total += len(boxes)
                 print(f"  Page {idx+1}: {len(boxes)} checks detected")
             else:
                 print(f"  Page {idx+1}: SKIPPED (no checks found)")
-        print(f"Total auto-detected: {total} checks across {len(self.pages)} pages")
+        return total
+
+    def _report_detection(self):
+        if self.layouts and self.layouts.hits:
+            print(f"  Layout reuse: {self.layouts.hits} of "
+                  f"{self.layouts.hits + self.layouts.misses} grid lookups")
+        if self.gate.total:
+            reasons = ", ".join(f"{n} {step}" for step, n in sorted(self.gate.skipped.items()))
+            print(f"  Pre-OCR gate skipped {self.gate.total} crops ({reasons})")
+
+    def _first_check_number(self):
+        """Check number to start page_range at so IDs match a full-document run."""
+        if self.first_check_number:
+            return int(self.first_check_number)
+        if self.first_page <= 1:
+            return 1
+        # Unknown numbering: detect (but don't crop) the pages before the range
+        before = 0
+        for start in range(1, self.first_page, self.page_budget):
+            last = min(start + self.page_budget - 1, self.first_page - 1)
+            pages = self._render_range(start, last)
+            for idx, p in enumerate(pages, start - 1):
+                boxes = detect_checks_on_page(p, format_hint=self.doc_format, scale=self.detect_scale,
+                                              method=self.detect_method, layouts=self.layouts,
+                                              gate=PreOcrGate(self.gate.steps), dpi_ratio=self._dpi_ratio(idx))
+                # Count what _crop_page would number (blank boxes get no ID)
+                before += len(self._croppable(idx, p, self._scale_boxes(boxes, self._page_scale(idx))))
+            del pages
+        print(f"  {before} checks on pages 1-{self.first_page - 1}; numbering from {before + 1}")
+        return before + 1
 
     # ── PHASE 1: Extract all images ──────────────────────────────────
-    def extract_all_images(self):
-        """Crop all detected checks and save as PNGs. Fast.
-        Flat images: images/check_XXXX.png (for API serving).
-        Per-page copies: images/page_X/cheque_Y.png (well-labeled).
+    def extract_all_images(self, on_page=None):
+        """Crop all detected checks and save them in the crop_profile format
+        (.png by default). Fast: files are encoded and written in the
+        background while cropping goes on, and crops stay in memory
+        (crop_images) for run_parallel_ocr. Call flush_crops() before
+        reading the files.
+        Flat images: images/check_XXXX.png (for API serving), encoded once.
+        Per-page view: images/page_X/cheque_Y.png are hard links to them
+        (copies where links fail), also listed in images/page_index.json.
+        on_page: optional callable(page_idx, page) called with each PageBuffer
+          as it is available (e.g. to save previews while streaming).
+        In streaming mode, pages are rendered, detected and cropped one window
+        at a time, so peak memory is bounded by page_budget.
         """
         img_dir = f"{self.output_dir}/images"
         os.makedirs(img_dir, exist_ok=True)
-        counter = 1
-        manifest = []  # list of (check_id, img_path, page_num)
+        counter = self._first_check_number()
+        manifest = []  # list of CheckCrop
+        detected = 0
+
+        for window in self._iter_page_windows():
+            if self.stream:
+                detected += self._detect_pages(window)
+            for pg, page_img in window:
+                if on_page:
+                    on_page(pg, page_img)
+                counter = self._crop_page(pg, page_img, img_dir, counter, manifest)
+            if self.stream:
+                window.clear()  # drop page pixels before the next window renders
+
+        if self.stream:
+            print(f"Total auto-detected: {detected} checks across "
+                  f"{max(0, self.last_page - self.first_page + 1)} pages")
+            self._report_detection()
+            self._record_template()
+        self._write_page_index(img_dir, manifest)
+        in_memory = sum(c.check_id in self.crop_images for c in manifest)
+        print(f"\nPhase 1 complete: {len(manifest)} check images saving to {img_dir}/ "
+              f"({self.crop_profile}; {in_memory} handed to OCR in memory)")
+        return manifest
 
-        for pg in range(len(self.pages)):
-            boxes = self.page_boxes.get(pg, [])
-            if not boxes:
+    @staticmethod
+    def _write_page_index(img_dir, manifest):
+        """images/page_index.json: {"page_X": {"cheque_Y.png": "check_XXXX.png"}},
+        merged with pages of earlier runs into the same folder."""
+        path = os.path.join(img_dir, "page_index.json")
+        index = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    index = json.load(f)
+            except (OSError, ValueError):
+                index = {}
+        by_page = defaultdict(dict)
+        for crop in manifest:
+            page = by_page[f"page_{crop.page}"]
+            ext = os.path.splitext(crop.image_path)[1]
+            page[f"cheque_{len(page) + 1}{ext}"] = crop.image_file
+        index.update(by_page)
+        with open(path, "w") as f:
+            json.dump(index, f, indent=2)
+
+    def _croppable(self, pg, page_img, boxes):
+        """(full-DPI box, page-pixel box) for each detected box that gets a
+        check number: clipped to the page, blank ones (mean > 252) left out."""
+        # Boxes are in full-DPI pixels; page_img may be a lower-DPI render
+        s = self._page_scale(pg)
+        full_w, full_h = self.page_sizes.get(pg) or (round(page_img.width * s), round(page_img.height * s))
+        kept = []
+        for (x1, y1, x2, y2) in boxes:
+            x1, y1 = max(0, x1), max(0, y1)
+            x2, y2 = min(full_w, x2), min(full_h, y2)
+            if x2 <= x1 or y2 <= y1:
                 continue
-            page_num = pg + 1
-            page_dir = os.path.join(img_dir, f"page_{page_num}")
-            os.makedirs(page_dir, exist_ok=True)
-            cheque_on_page = 0
-            page_img = self.pages[pg]
-            for (x1, y1, x2, y2) in boxes:
-                x1, y1 = max(0, x1), max(0, y1)
-                x2, y2 = min(page_img.width, x2), min(page_img.height, y2)
-                if x2 <= x1 or y2 <= y1:
-                    continue
-                crop = page_img.crop((x1, y1, x2, y2))
-                arr = np.array(crop.convert("L"))
-                if np.mean(arr) > 252:
-                    continue
-                cheque_on_page += 1
-                cid = f"check_{counter:04d}"
-                img_path = os.path.join(img_dir, f"{cid}.png")
-                crop.save(img_path)
-                # Also save well-labeled copy in per-page subfolder
-                crop.save(os.path.join(page_dir, f"cheque_{cheque_on_page}.png"))
-                manifest.append((cid, img_path, page_num))
-                counter += 1
-
-        print(f"\nPhase 1 complete: {len(manifest)} check images saved to {img_dir}/")
-        return manifest
+            page_box = (int(x1 / s), int(y1 / s), math.ceil(x2 / s), math.ceil(y2 / s))
+            if np.mean(page_img.gray_crop(page_box)) > 252:
+                continue
+            kept.append(((x1, y1, x2, y2), page_box))
+        return kept
+
+    def _crop_page(self, pg, page_img, img_dir, counter, manifest):
+        """Crop and save the detected checks of one page; returns next counter."""
+        boxes = self.page_boxes.get(pg, [])
+        if not boxes:
+            return counter
+        page_num = pg + 1
+        page_dir = os.path.join(img_dir, f"page_{page_num}")
+        os.makedirs(page_dir, exist_ok=True)
+        kept = [(box, page_img.crop(page_box)) for box, page_box in self._croppable(pg, page_img, boxes)]
+
+        if kept and pg not in self.native_pages and (self.grayscale or self._page_scale(pg) != 1):
+            kept = self._render_crops(page_num, kept)
+
+        profile = CROP_PROFILES[self.crop_profile]
+        if self._crop_writer is None and CROP_WRITE_WORKERS > 1:
+            self._crop_writer = ThreadPoolExecutor(max_workers=CROP_WRITE_WORKERS)
+        for cheque_on_page, (box, crop) in enumerate(kept, 1):
+            cid = f"check_{counter:04d}"
+            self.check_boxes[cid] = (pg, box)
+            img_path = os.path.join(img_dir, f"{cid}{profile['ext']}")
+            image = CropImage(img_path, crop, profile)
+            # Well-labeled per-page name for the same file (no second encode)
+            page_path = os.path.join(page_dir, f"cheque_{cheque_on_page}{profile['ext']}")
+            record = CheckCrop(cid, page_num, img_path, page_path=page_path, bbox=box,
+                               width=image.size[0], height=image.size[1])
+            if self.crop_index:
+                self.crop_fingerprints[cid] = crop_fingerprint(image.pixels())
+                record.sha256 = self.crop_fingerprints[cid]["sha256"]
+            keep = self._handoff_used + image.pixels().nbytes <= self.crop_handoff_bytes
+            if keep:
+                self._handoff_used += image.pixels().nbytes
+                self.crop_images[cid] = image
+            if self._crop_writer:
+                self._crop_writes[cid] = (record, self._crop_writer.submit(
+                    self._write_crop, record, image, profile, keep))
+            else:
+                self._write_crop(record, image, profile, keep)
+            manifest.append(record)
+            counter += 1
+        return counter
+
+    @staticmethod
+    def _write_crop(record, image, profile, keep):
+        """Hash, encode and write one crop (writer thread, or inline); fills
+        the record's sha256 and image_bytes."""
+        record.image_bytes = image.write(profile, [record.page_path], keep, digest=record.sha256 is None)
+        record.sha256 = record.sha256 or image.sha256
+
+    def flush_crops(self):
+        """Wait for the background crop writes (records get their image_bytes)
+        and shut the writer down; _crop_page starts a new one if needed."""
+        pending, self._crop_writes = self._crop_writes, {}
+        for cid, (_, future) in pending.items():
+            try:
+                future.result()
+            except Exception as e:
+                print(f"  Crop write failed for {cid}: {e}")
+        if self._crop_writer is not None:
+            self._crop_writer.shutdown(wait=True)
+            self._crop_writer = None
+        if pending:
+            total_kb = sum(record.image_bytes or 0 for record, _ in pending.values()) // 1024
+            print(f"  Crops written: {len(pending)} ({self.crop_profile}, {total_kb} KB)")
+
+    def _await_crop_write(self, cid):
+        """Wait until check cid's crop file is on disk (a no-op once flushed);
+        a failed write is reported by flush_crops()."""
+        pending = self._crop_writes.get(cid)
+        if pending:
+            try:
+                pending[1].result()
+            except Exception:
+                pass
+
+    def release_crops(self):
+        """Drop the in-memory crops handed to the engines; OCR then reads the
+        written files. For apps kept around between analysis and extraction."""
+        self.flush_crops()
+        crops, self.crop_images = self.crop_images, {}
+        for image in crops.values():
+            image.release()
+        self._handoff_used = 0
+
+    def _render_crops(self, page_num, kept):
+        """Render each check region in colour at full DPI straight from the PDF
+        (grayscale and two-pass modes). If Poppler fails, the crop from the
+        rendered page is used, resized to the full-DPI box."""
+        def _render(item):
+            box, page_crop = item
+            crop = render_pdf_region(self.pdf_path, page_num, box, dpi=self.dpi)
+            if crop is None:
+                size = (box[2] - box[0], box[3] - box[1])
+                crop = _as_image(page_crop)
+                if crop.size != size:
+                    crop = crop.resize(size, Image.Resampling.LANCZOS)
+            return box, crop
+
+        with ThreadPoolExecutor(max_workers=min(4, len(kept))) as pool:
+            return list(pool.map(_render, kept))
+
+    # ── Text-layer prefill (before Phase 2) ─────────────────────────
+    def extract_text_layer(self, manifest):
+        """Read check number, date and amount from the PDF text layer.
+        Words are matched to each check's box (extended below by 25% of its
+        height, where statements print the posting row).
+        Returns {check_id: {field: value}} for checks with at least one hit."""
+        located = [(c.check_id, self.check_boxes[c.check_id]) for c in manifest if c.check_id in self.check_boxes]
+        if not self.pdf_path or not located:
+            return {}
+        page_nums = sorted({pg + 1 for _, (pg, _) in located})
+        try:
+            words = pdf_text_words(self.pdf_path, page_nums[0], page_nums[-1])
+        except Exception as e:
+            print(f"  Text layer unavailable: {e}")
+            return {}
+
+        prefill = {}
+        for cid, (pg, (x1, y1, x2, y2)) in located:
+            page_w_pt, page_h_pt, page_words = words.get(pg + 1, (0, 0, []))
+            size = self.page_sizes.get(pg)
+            if not page_words or not size or not page_w_pt:
+                continue
+            # PDF points -> full-DPI (or native) pixels of this page
+            sx, sy = size[0] / page_w_pt, size[1] / page_h_pt
+            y2 += int((y2 - y1) * 0.25)
+            inside = [w for w in page_words
+                      if x1 <= (w[0] + w[2]) / 2 * sx <= x2 and y1 <= (w[1] + w[3]) / 2 * sy <= y2]
+            fields = _parse_text_layer(_words_to_text(inside)) if inside else {}
+            if fields:
+                prefill[cid] = fields
+        print(f"  Text layer: pre-filled {len(prefill)}/{len(manifest)} checks")
+        return prefill
 
     # ── PHASE 2: Parallel OCR ────────────────────────────────────────
-    def run_parallel_ocr(self, manifest, methods=None, progress_callback=None):
+    def run_parallel_ocr(self, manifest, methods=None, progress_callback=None, prefill=None,
+                         force=False):
         """Run selected OCR engines in parallel for each check.
         methods: list of engine names. Supported values:
           'hybrid' = all 3 engines + merge
@@ -1138,6 +2742,12 @@ class CheckExtractorApp:
           'tesseract', 'numarkdown', 'gemini' = individual engines
         Default (None or ['hybrid']) = run all 3 + merge.
         progress_callback: optional callable(info_dict) called after each check completes.
+        prefill: {check_id: {field: value}} of printed fields already known
+          (see extract_text_layer; computed here when text_layer is on).
+          Checks with all TEXT_LAYER_FIELDS skip Tesseract and ask Gemini
+          for the handwritten fields only.
+        force: run the engines on every check, reusing nothing from the crop
+          index (results are still indexed, replacing earlier ones).
         """
         results_dir = f"{self.output_dir}/ocr_results"
         os.makedirs(results_dir, exist_ok=True)
@@ -1155,8 +2765,17 @@ class CheckExtractorApp:
         if run_numd: engine_names.append("numarkdown")
         if run_gemi: engine_names.append("gemini")
 
+        if prefill is None:
+            prefill = self.extract_text_layer(manifest) if self.text_layer else {}
+
+        # Crops OCR'd before (earlier jobs, or repeats in this document) reuse that result
+        reused, twins, fingerprints = self._find_duplicates(manifest, engine_names, prefill, force)
+
         total = len(manifest)
         print(f"\nPhase 2: Running engines [{', '.join(engine_names)}] on {total} checks...")
+        if reused or twins:
+            print(f"  Dedupe: {len(reused)} checks seen in earlier jobs, {len(twins)} repeated in this "
+                  f"document; {total - len(reused) - len(twins)} to OCR")
 
         # Notify callback of start
         if progress_callback:
@@ -1166,8 +2785,9 @@ class CheckExtractorApp:
                 "engines": engine_names,
             })
 
-        def process_single_check(idx, cid, img_path, page_num):
+        def process_single_check(idx, item):
             """Process a single check with all selected OCR engines in parallel."""
+            cid, page_num = item.check_id, item.page
             check_dir = os.path.join(results_dir, cid)
             os.makedirs(check_dir, exist_ok=True)
 
@@ -1189,16 +2809,27 @@ class CheckExtractorApp:
             numd_result = {"source": "numarkdown", "fields": _empty_fields(), "processing_time_ms": 0}
             gemi_result = {"source": "gemini", "fields": _empty_fields(), "processing_time_ms": 0}
 
+            # Printed fields from the text layer: Tesseract adds nothing, Gemini
+            # only needs the handwritten ones
+            known = prefill.get(cid, {})
+            printed_known = all(known.get(f) for f in TEXT_LAYER_FIELDS)
+            # The Phase 1 crop in memory when there is one, else the file
+            crop = self.crop_images.get(cid)
+            if crop is None:
+                crop = item.image_path
+                self._await_crop_write(cid)
+
             with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
                 futures = {}
-                if run_tess:
-                    futures["tesseract"] = pool.submit(extract_with_tesseract, img_path)
+                if run_tess and not printed_known:
+                    futures["tesseract"] = pool.submit(extract_with_tesseract, crop)
                 if run_numd:
-                    futures["numarkdown"] = pool.submit(extract_with_numarkdown, img_path)
+                    futures["numarkdown"] = pool.submit(extract_with_numarkdown, crop)
                 if run_gemi:
                     # Pin a Gemini key to this check by worker index to avoid race conditions
                     pinned_key = GEMINI_KEYS[idx % len(GEMINI_KEYS)] if GEMINI_KEYS else None
-                    futures["gemini"] = pool.submit(extract_with_gemini, img_path, pinned_key)
+                    prompt = GEMINI_HANDWRITTEN_PROMPT if printed_known else GEMINI_PROMPT
+                    futures["gemini"] = pool.submit(extract_with_gemini, crop, pinned_key, prompt)
 
                 if "tesseract" in futures:
                     tess_result = futures["tesseract"].result()
@@ -1206,17 +2837,18 @@ class CheckExtractorApp:
                     numd_result = futures["numarkdown"].result()
                 if "gemini" in futures:
                     gemi_result = futures["gemini"].result()
+            if crop is not item.image_path:
+                self.crop_images.pop(cid, None)
+                crop.release()
 
             # Save individual engine results
-            if run_tess:
-                with open(os.path.join(check_dir, "tesseract.json"), "w") as f:
-                    json.dump(tess_result, f, indent=2)
-            if run_numd:
-                with open(os.path.join(check_dir, "numarkdown.json"), "w") as f:
-                    json.dump(numd_result, f, indent=2)
+            engine_results = {name: result for name, result, ran in (
+                ("tesseract", tess_result, run_tess), ("numarkdown", numd_result, run_numd),
+                ("gemini", gemi_result, run_gemi)) if ran}
+            for name, result in engine_results.items():
+                with open(os.path.join(check_dir, f"{name}.json"), "w") as f:
+                    json.dump(result, f, indent=2)
             if run_gemi:
-                with open(os.path.join(check_dir, "gemini.json"), "w") as f:
-                    json.dump(gemi_result, f, indent=2)
                 # Log Gemini extraction details
                 g_fields = gemi_result.get("fields", {})
                 print(f"\n    Gemini extracted: payee={g_fields.get('payee')}, amount={g_fields.get('amount')}, date={g_fields.get('checkDate')}, check#={g_fields.get('checkNumber')}")
@@ -1225,6 +2857,11 @@ class CheckExtractorApp:
 
             # Merge (works even if some engines returned empty fields)
             hybrid = merge_all(tess_result, numd_result, gemi_result)
+            for field, value in known.items():
+                hybrid[field] = {"value": value, "confidence": 0.99, "source": "text_layer"}
+            if known:
+                with open(os.path.join(check_dir, "text_layer.json"), "w") as f:
+                    json.dump({"source": "text_layer", "fields": known}, f, indent=2)
             
             # Collect API usage data for billing
             api_usage = {}
@@ -1236,7 +2873,7 @@ class CheckExtractorApp:
             hybrid_out = {
                 "check_id": cid,
                 "page": page_num,
-                "image_file": f"{cid}.png",
+                "image_file": item.image_file,
                 "timestamp": datetime.now().isoformat(),
                 "extraction": hybrid,
                 "methods_used": engine_names,
@@ -1246,9 +2883,15 @@ class CheckExtractorApp:
                     "gemini": gemi_result.get("processing_time_ms", 0),
                 },
                 "api_usage": api_usage,
+                "prefilled": sorted(known),
             }
             with open(os.path.join(check_dir, "hybrid.json"), "w") as f:
                 json.dump(hybrid_out, f, indent=2)
+            if cid in fingerprints and not any(r.get("error") for r in engine_results.values()):
+                self.crop_index.add(fingerprints[cid], {
+                    "job": self.job_name, "check_id": cid, "methods_used": engine_names,
+                    "extraction": hybrid, "engines": engine_results,
+                })
 
             t_ms = tess_result.get("processing_time_ms", 0)
             n_ms = numd_result.get("processing_time_ms", 0)
@@ -1282,15 +2925,85 @@ class CheckExtractorApp:
             
             return (idx, cid, page_num)
 
+        def reuse_check(idx, item, source, dedupe):
+            """Write a check's results from an earlier OCR of the same crop
+            (`source`: methods_used, extraction, engines) without running engines."""
+            cid, page_num = item.check_id, item.page
+            check_dir = os.path.join(results_dir, cid)
+            os.makedirs(check_dir, exist_ok=True)
+            if progress_callback:
+                progress_callback({"event": "check_start", "check_id": cid, "page": page_num,
+                                   "index": idx, "total": total})
+            crop = self.crop_images.pop(cid, None)
+            if crop is not None:
+                crop.release()
+            for name, result in source.get("engines", {}).items():
+                if name in engine_names:
+                    with open(os.path.join(check_dir, f"{name}.json"), "w") as f:
+                        json.dump(result, f, indent=2)
+            hybrid = json.loads(json.dumps(source["extraction"]))
+            known = prefill.get(cid, {})
+            for field, value in known.items():
+                hybrid[field] = {"value": value, "confidence": 0.99, "source": "text_layer"}
+            hybrid_out = {
+                "check_id": cid,
+                "page": page_num,
+                "image_file": item.image_file,
+                "timestamp": datetime.now().isoformat(),
+                "extraction": hybrid,
+                "methods_used": source.get("methods_used", engine_names),
+                "engine_times_ms": {"tesseract": 0, "numarkdown": 0, "gemini": 0},
+                "api_usage": {},
+                "prefilled": sorted(known),
+                "deduplicated": dedupe,
+            }
+            with open(os.path.join(check_dir, "hybrid.json"), "w") as f:
+                json.dump(hybrid_out, f, indent=2)
+            payee = (hybrid.get("payee") or {}).get("value") or "?"
+            print(f"  [{idx+1}/{total}] {cid} (page {page_num}): {dedupe['match']} duplicate of "
+                  f"{dedupe['job']}/{dedupe['check_id']} | payee={payee}")
+            if progress_callback:
+                progress_callback({"event": "check_done", "check_id": cid, "page": page_num,
+                                   "index": idx, "total": total, "payee": payee,
+                                   "engine_times_ms": {"tesseract": 0, "numarkdown": 0, "gemini": 0},
+                                   "engines": [], "has_error": False, "deduplicated": dedupe})
+            return (idx, cid, page_num)
+
+        def reuse_twin(idx, item):
+            """Copy the result of the first occurrence of a repeated crop; OCR it
+            normally if that result is missing."""
+            dedupe = twins[item.check_id]
+            twin_dir = os.path.join(results_dir, dedupe["check_id"])
+            try:
+                with open(os.path.join(twin_dir, "hybrid.json")) as f:
+                    twin = json.load(f)
+                engines = {}
+                for name in engine_names:
+                    path = os.path.join(twin_dir, f"{name}.json")
+                    if os.path.exists(path):
+                        with open(path) as f:
+                            engines[name] = json.load(f)
+            except (OSError, ValueError):
+                return process_single_check(idx, item)
+            source = {"methods_used": twin.get("methods_used"), "engines": engines,
+                      "extraction": twin["extraction"]}
+            return reuse_check(idx, item, source, dedupe)
+
+        for idx, item in enumerate(manifest):
+            if item.check_id in reused:
+                reuse_check(idx, item, *reused[item.check_id])
+        to_ocr = [(idx, item) for idx, item in enumerate(manifest)
+                  if item.check_id not in reused and item.check_id not in twins]
+
         # Process ALL checks in parallel (Promise.all equivalent)
         # Scale workers with number of Gemini keys: each key handles ~8 checks concurrently
         n_keys = max(1, len(GEMINI_KEYS))
-        max_concurrent_checks = min(n_keys * 8, total, 50)  # Up to 50 concurrent (was min(4, total))
-        print(f"  Running {total} checks with {max_concurrent_checks} concurrent workers ({n_keys} API keys × 8 = {n_keys * 8} theoretical max)")
+        max_concurrent_checks = max(1, min(n_keys * 8, len(to_ocr), 50))  # Up to 50 concurrent (was min(4, total))
+        print(f"  Running {len(to_ocr)} checks with {max_concurrent_checks} concurrent workers ({n_keys} API keys × 8 = {n_keys * 8} theoretical max)")
         with ThreadPoolExecutor(max_workers=max_concurrent_checks) as executor:
             futures = [
-                executor.submit(process_single_check, idx, cid, img_path, page_num)
-                for idx, (cid, img_path, page_num) in enumerate(manifest)
+                executor.submit(process_single_check, idx, item)
+                for idx, item in to_ocr
             ]
             
             # Wait for all to complete (as_completed gives results as they finish)
@@ -1302,15 +3015,73 @@ class CheckExtractorApp:
                     import traceback
                     traceback.print_exc()
 
+        # Repeats within this document, once their first occurrence is done
+        for idx, item in enumerate(manifest):
+            if item.check_id in twins:
+                reuse_twin(idx, item)
+
+        self.flush_crops()
         print(f"\nPhase 2 complete: results in {results_dir}/")
 
+    def _find_duplicates(self, manifest, engine_names, prefill=None, force=False):
+        """Checks whose OCR can be reused, by crop fingerprint: ({cid: (source,
+        dedupe)} found in the crop index, {cid: dedupe} repeating an earlier
+        check of this manifest, {cid: fingerprint} of the checks to index).
+        dedupe = {job, check_id, match: "exact"|"near", distance}. Index hits
+        count only if they ran at least the requested engines. Repeats within
+        the manifest must be pixel-identical: a statement's cheques share one
+        template, so their dHashes are a few bits apart. A near index hit also
+        needs the check's text-layer check number (prefill) to equal the
+        indexed one. Records this job wrote itself are never reused, and
+        force only fingerprints (to index the new results)."""
+        prefill = prefill or {}
+        if not self.crop_index:
+            return {}, {}, {}
+        reused, twins, fingerprints, firsts = {}, {}, {}, []
+        for item in manifest:
+            cid = item.check_id
+            fp = self.crop_fingerprints.get(cid)
+            if fp is None:
+                try:
+                    self._await_crop_write(cid)
+                    fp = self.crop_fingerprints[cid] = fingerprint_file(item.image_path)
+                except Exception as e:
+                    print(f"  Crop fingerprint failed for {cid}: {e}")
+                    continue
+            fingerprints[cid] = fp
+            if force:
+                continue
+            for first_fp, first_cid in firsts:
+                match = match_crops(first_fp, fp, 0)
+                if match:
+                    twins[cid] = {"job": self.job_name, "check_id": first_cid,
+                                  "match": match[0], "distance": match[1]}
+                    break
+            if cid in twins:
+                continue
+            firsts.append((fp, cid))
+            hit = self.crop_index.lookup(fp)
+            if (hit and hit[0].get("job") != self.job_name
+                    and set(engine_names) <= set(hit[0].get("methods_used", []))):
+                record, match, distance = hit
+                if match == "near" and not _same_check_number(prefill.get(cid), record):
+                    continue
+                reused[cid] = (record, {"job": record.get("job"), "check_id": record.get("check_id"),
+                                        "match": match, "distance": distance})
+        return reused, twins, fingerprints
+
+    @property
+    def job_name(self):
+        """Name of this run in crop-index records (the output folder, i.e. the API job id)."""
+        return os.path.basename(os.path.normpath(self.output_dir))
+
     # ── Summary ──────────────────────────────────────────────────────
     def save_summary(self, manifest):
         checks = []
         results_dir = f"{self.output_dir}/ocr_results"
-        for cid, img_path, page_num in manifest:
-            hybrid_path = os.path.join(results_dir, cid, "hybrid.json")
-            entry = {"check_id": cid, "page": page_num, "image_file": f"{cid}.png"}
+        for item in manifest:
+            hybrid_path = os.path.join(results_dir, item.check_id, "hybrid.json")
+            entry = item.to_json(paths=False)
             if os.path.exists(hybrid_path):
                 try:
                     with open(hybrid_path) as f:
@@ -1321,7 +3092,7 @@ class CheckExtractorApp:
 
         summary = {
             "pdf_file": self.pdf_path,
-            "total_pages": len(self.pages),
+            "total_pages": self.page_count,
             "total_checks": len(checks),
             "engines": ["tesseract", "numarkdown", "gemini"],
             "checks": checks,
@@ -1335,6 +3106,7 @@ class CheckExtractorApp:
     # ── Run (headless) ───────────────────────────────────────────────
     def run(self):
         manifest = self.extract_all_images()
+        self.flush_crops()
         if not manifest:
             print("No checks found.")
             return
@@ -1346,6 +3118,8 @@ class CheckExtractorApp:
         """Show Tkinter GUI to preview detected boxes, then extract."""
         if not GUI_AVAILABLE:
             raise RuntimeError("GUI not available in headless mode. Use run_headless() instead.")
+        if self.stream:
+            raise RuntimeError("Preview needs all pages in memory; construct with stream=False.")
         self.root = tk.Tk()
         self.root.title(f"Check Extractor – {os.path.basename(self.pdf_path)}")
         self.root.state("zoomed")
@@ -1398,7 +3172,7 @@ class CheckExtractorApp:
         dw = int(img_w * self.scale_factor)
         dh = int(img_h * self.scale_factor)
 
-        self._disp = page_img.resize((dw, dh), Image.Resampling.LANCZOS)
+        self._disp = page_img.to_image().resize((dw, dh), Image.Resampling.LANCZOS)
         self._photo = ImageTk.PhotoImage(self._disp)
 
         self.canvas.delete("all")
@@ -1408,9 +3182,10 @@ class CheckExtractorApp:
         self.page_label.config(text=f"Page {self.current_page+1} / {len(self.pages)}")
 
         boxes = self.page_boxes.get(self.current_page, [])
+        box_factor = self.scale_factor / self._page_scale(self.current_page)  # boxes are in full-DPI pixels
         for idx, (x1, y1, x2, y2) in enumerate(boxes):
-            dx1, dy1 = x1 * self.scale_factor, y1 * self.scale_factor
-            dx2, dy2 = x2 * self.scale_factor, y2 * self.scale_factor
+            dx1, dy1 = x1 * box_factor, y1 * box_factor
+            dx2, dy2 = x2 * box_factor, y2 * box_factor
             self.canvas.create_rectangle(dx1, dy1, dx2, dy2, outline="blue", width=2)
             self.canvas.create_text(dx1 + 4, dy1 + 2, anchor=tk.NW,
                                     text=f"#{idx+1}", fill="blue", font=("Arial", 10, "bold"))
@@ -1429,8 +3204,9 @@ class CheckExtractorApp:
             self._show_page()
 
     def _redetect(self):
-        boxes = detect_checks_on_page(self.pages[self.current_page])
-        self.page_boxes[self.current_page] = boxes
+        boxes = detect_checks_on_page(self.pages[self.current_page], scale=self.detect_scale,
+                                      method=self.detect_method, dpi_ratio=self._dpi_ratio(self.current_page))
+        self.page_boxes[self.current_page] = self._scale_boxes(boxes, self._page_scale(self.current_page))
         self._show_page()
 
     def _gui_extract(self):
@@ -1443,9 +3219,23 @@ class CheckExtractorApp:
 #  CLI
 # ═════════════════════════════════════════════════════════════════════
 
+def _cli_option(name, default=None):
+    """Value of a `--name VALUE` command-line option."""
+    if name in sys.argv:
+        i = sys.argv.index(name)
+        if i + 1 < len(sys.argv):
+            return sys.argv[i + 1]
+    return default
+
+
 def main():
     if len(sys.argv) < 2:
-        print("Usage: python check_extractor.py <pdf_file> [--preview]")
+        print("Usage: python check_extractor.py <pdf_file> [--preview] [--stream] [--page-budget N]"
+              " [--grayscale] [--raster-workers N] [--detect-dpi N] [--page-cache DIR]"
+              " [--embedded-images] [--text-layer] [--detect-scale F] [--detect-processes N]"
+              " [--detect-method contours|components] [--no-layout-reuse] [--layout-store DIR]"
+              " [--pre-ocr-gate snap,shape,blanks,backs|none] [--crop-profile png|png-fast|webp|jpeg]"
+              " [--crop-handoff-mb N] [--tmpfs]")
         return
     pdf_path = sys.argv[1]
     if not os.path.exists(pdf_path):
@@ -1453,9 +3243,57 @@ def main():
         return
 
     preview = "--preview" in sys.argv
+    # Preview browses all pages, so it always keeps them in memory
+    stream = False if preview else ("--stream" in sys.argv or None)
+    page_budget = _cli_option("--page-budget")
+    grayscale = "--grayscale" in sys.argv or None
+    raster_workers = _cli_option("--raster-workers")
+    detect_dpi = _cli_option("--detect-dpi")
+    embedded_images = "--embedded-images" in sys.argv or None
+    text_layer = "--text-layer" in sys.argv or None
+    detect_scale = _cli_option("--detect-scale")
+    detect_workers = _cli_option("--detect-processes")
+    detect_method = _cli_option("--detect-method")
+    layout_reuse = False if "--no-layout-reuse" in sys.argv else None
+    pre_ocr_gate = _cli_option("--pre-ocr-gate")
+    crop_profile = _cli_option("--crop-profile")
+    crop_handoff_mb = _cli_option("--crop-handoff-mb")
+    page_cache = None
+    if _cli_option("--page-cache"):
+        page_cache = PageCache(_cli_option("--page-cache"))
+    layout_store = None
+    if _cli_option("--layout-store"):
+        layout_store = LayoutStore(_cli_option("--layout-store"))
+
+    preflight = pdf_preflight(pdf_path)
+    print(f"Preflight: {preflight['page_count']} pages ({preflight['scan_pages']} scanned, "
+          f"{preflight['vector_pages']} vector, {preflight['mixed_pages']} mixed) "
+          f"in {preflight['elapsed_ms']} ms")
+    problems = preflight_problems(preflight)
+    if problems:
+        print(f"Rejected: {'; '.join(problems)}")
+        return
 
     name = os.path.splitext(os.path.basename(pdf_path))[0]
-    app = CheckExtractorApp(pdf_path, output_dir=f"extracted_{name}")
+    output_dir = f"extracted_{name}"
+    if "--tmpfs" in sys.argv:
+        output_dir = tmpfs_output_dir(output_dir) or output_dir
+        print(f"Output in {output_dir}")
+    app = CheckExtractorApp(pdf_path, output_dir=output_dir,
+                            stream=stream, page_budget=int(page_budget) if page_budget else None,
+                            grayscale=grayscale,
+                            raster_workers=int(raster_workers) if raster_workers else None,
+                            detect_dpi=int(detect_dpi) if detect_dpi else None,
+                            page_cache=page_cache, embedded_images=embedded_images,
+                            text_layer=text_layer, preflight=preflight,
+                            detect_scale=float(detect_scale) if detect_scale else None,
+                            detect_processes=True if detect_workers else None,
+                            detect_workers=int(detect_workers) if detect_workers else None,
+                            detect_method=detect_method, layout_reuse=layout_reuse,
+                            layout_store=layout_store,
+                            pre_ocr_gate=pre_ocr_gate.split(",") if pre_ocr_gate else None,
+                            crop_profile=crop_profile,
+                            crop_handoff_mb=int(crop_handoff_mb) if crop_handoff_mb else None)
 
     if preview:
         app.run_preview()
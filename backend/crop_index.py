@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Cross-job index of check crops, so a cheque OCR'd once is not OCR'd again.
+
+Overlapping statements (monthly plus quarterly) crop the same cheque in
+several jobs. Each crop gets an exact content hash (SHA-256 of its decoded
+pixels, so PNG encoder settings don't matter) and a 256-bit difference
+hash (dHash of a 17x16 grayscale thumbnail), which survives re-rendering
+and crop boundaries a few pixels off. The index maps them to the OCR
+result of the first job that read the cheque; a later crop with the same
+content hash, or (when max_distance > 0) a dHash within max_distance bits
+and a similar aspect, reuses it. Cheques printed from one template differ
+by only a few dHash bits, so near matches are off by default and callers
+must confirm them from content. Records are evicted oldest-first beyond
+max_entries.
+
+Layout:
+  <index_dir>/<sha256>.json   one record per OCR'd crop
+  <index_dir>/dhash.tsv       "<sha256>\t<dhash hex>\t<aspect>" per record
+"""
+
+import os
+import json
+import hashlib
+import threading
+import uuid
+from datetime import datetime
+
+import cv2
+import numpy as np
+from PIL import Image
+
+DHASH_SIZE = 16        # dHash grid: 16x16 = 256 bits
+ASPECT_TOLERANCE = 0.05
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def pixel_sha256(image):
+    """SHA-256 of a crop's decoded pixels (with shape and dtype), hex."""
+    pixels = np.asarray(image)
+    sha = hashlib.sha256(f"{pixels.shape}{pixels.dtype}".encode())
+    sha.update(np.ascontiguousarray(pixels).data)
+    return sha.hexdigest()
+
+
+def crop_fingerprint(image):
+    """{"sha256", "dhash", "aspect"} of a crop (PIL image or array)."""
+    pixels = np.asarray(image)
+    h, w = pixels.shape[:2]
+    gray = pixels if pixels.ndim == 2 else cv2.cvtColor(np.ascontiguousarray(pixels[..., :3]),
+                                                         cv2.COLOR_RGB2GRAY)
+    thumb = cv2.resize(gray, (DHASH_SIZE + 1, DHASH_SIZE), interpolation=cv2.INTER_AREA)
+    bits = np.packbits(thumb[:, 1:] > thumb[:, :-1])
+    return {"sha256": pixel_sha256(pixels), "dhash": bits.tobytes().hex(), "aspect": round(w / max(h, 1), 4)}
+
+
+def fingerprint_file(path):
+    with Image.open(path) as im:
+        return crop_fingerprint(im.convert("RGB") if im.mode not in ("RGB", "L") else im)
+
+
+def _dhash_bytes(hex_str):
+    return np.frombuffer(bytes.fromhex(hex_str), dtype=np.uint8)
+
+
+def dhash_distance(a, b):
+    """Differing dHash bits between two fingerprints."""
+    return int(_POPCOUNT[_dhash_bytes(a["dhash"]) ^ _dhash_bytes(b["dhash"])].sum())
+
+
+def _similar_aspect(a, b):
+    return abs(a - b) <= ASPECT_TOLERANCE * max(a, b)
+
+
+def match_crops(a, b, max_distance):
+    """("exact", 0) or ("near", bits) if two fingerprints are the same crop, else None."""
+    if a["sha256"] == b["sha256"]:
+        return "exact", 0
+    if max_distance > 0 and _similar_aspect(a["aspect"], b["aspect"]):
+        d = dhash_distance(a, b)
+        if d <= max_distance:
+            return "near", d
+    return None
+
+
+class CropIndex:
+    def __init__(self, index_dir, max_entries=20000, max_distance=0):
+        self.index_dir = str(index_dir)
+        self.max_entries = int(max_entries)
+        self.max_distance = int(max_distance)
+        self._lock = threading.Lock()
+        os.makedirs(self.index_dir, exist_ok=True)
+        self._load_table()
+
+    def _record_path(self, sha):
+        return os.path.join(self.index_dir, f"{sha}.json")
+
+    @property
+    def _table_path(self):
+        return os.path.join(self.index_dir, "dhash.tsv")
+
+    def _load_table(self):
+        """dHash table (sha list, (N, 32) bit bytes, aspects) from dhash.tsv."""
+        rows = []
+        if os.path.exists(self._table_path):
+            with open(self._table_path) as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) == 3 and os.path.exists(self._record_path(parts[0])):
+                        rows.append(parts)
+        self._shas = [r[0] for r in rows]
+        self._bits = np.array([_dhash_bytes(r[1]) for r in rows], dtype=np.uint8).reshape(-1, DHASH_SIZE ** 2 // 8)
+        self._aspects = np.array([float(r[2]) for r in rows], dtype=np.float64)
+
+    # ── Read ─────────────────────────────────────────────────────────
+    def _read(self, sha):
+        try:
+            with open(self._record_path(sha)) as f:
+                return json.load(f)
+        except Exception:
+            return None
+
+    def lookup(self, fp):
+        """(record, match, distance) for an indexed crop matching fingerprint
+        `fp` (exact hash first, then the nearest dHash), or None."""
+        record = self._read(fp["sha256"])
+        if record is not None:
+            return record, "exact", 0
+        if self.max_distance <= 0:
+            return None
+        with self._lock:
+            if not self._shas:
+                return None
+            dist = _POPCOUNT[self._bits ^ _dhash_bytes(fp["dhash"])].sum(axis=1).astype(np.int64)
+            ok = np.abs(self._aspects - fp["aspect"]) <= ASPECT_TOLERANCE * np.maximum(self._aspects, fp["aspect"])
+            dist[~ok] = DHASH_SIZE ** 2 + 1
+            best = int(dist.argmin())
+            if dist[best] > self.max_distance:
+                return None
+            sha, distance = self._shas[best], int(dist[best])
+        record = self._read(sha)
+        return (record, "near", distance) if record is not None else None
+
+    # ── Write ────────────────────────────────────────────────────────
+    def add(self, fp, record):
+        """Index the OCR result of a crop, then evict."""
+        path = self._record_path(fp["sha256"])
+        record = dict(record, fingerprint=fp, indexed=datetime.now().isoformat(timespec="seconds"))
+        tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(record, f)
+            os.replace(tmp, path)
+            with self._lock:
+                if fp["sha256"] in self._shas:
+                    return  # re-OCR of an indexed crop: record replaced above
+                with open(self._table_path, "a") as f:
+                    f.write(f"{fp['sha256']}\t{fp['dhash']}\t{fp['aspect']}\n")
+                self._shas.append(fp["sha256"])
+                self._bits = np.vstack([self._bits, _dhash_bytes(fp["dhash"])[None, :]])
+                self._aspects = np.append(self._aspects, fp["aspect"])
+        except Exception as e:
+            print(f"  Crop index: write failed for {fp['sha256'][:12]}…: {e}")
+            return
+        if len(self._shas) > self.max_entries:
+            self.evict()
+
+    # ── Eviction ─────────────────────────────────────────────────────
+    def evict(self):
+        """Drop the oldest records beyond max_entries and rewrite the table."""
+        with self._lock:
+            records = []
+            for name in os.listdir(self.index_dir):
+                if name.endswith(".json"):
+                    try:
+                        records.append((os.path.getmtime(os.path.join(self.index_dir, name)), name))
+                    except OSError:
+                        pass
+            records.sort()
+            for _, name in records[:max(0, len(records) - self.max_entries)]:
+                try:
+                    os.remove(os.path.join(self.index_dir, name))
+                except OSError:
+                    pass
+            keep = [(s, b, a) for s, b, a in zip(self._shas, self._bits, self._aspects)
+                    if os.path.exists(self._record_path(s))]
+            tmp = f"{self._table_path}.{uuid.uuid4().hex[:8]}.tmp"
+            with open(tmp, "w") as f:
+                for s, b, a in keep:
+                    f.write(f"{s}\t{b.tobytes().hex()}\t{a}\n")
+            os.replace(tmp, self._table_path)
+            self._load_table()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Detector benchmark: contours (RETR_TREE) vs. connected components.
+
+Renders each PDF at RASTER_DPI and times, per DETECT_METHOD, both the
+bordered-box candidate finder alone and full detect_checks_on_page, on
+fresh (unmemoized) preprocessing each run. Reports pages/second and
+whether both methods return the same boxes. Intended for Format A
+(bordered) statements; the voted format is printed for each document.
+
+Usage:
+  python detect_benchmark.py <pdf> [<pdf> ...] [--repeat 3] [--scale 1.0]
+"""
+
+import sys
+import time
+
+from check_extractor import (DETECT_METHODS, RASTER_DPI, PagePrep, PageBuffer, _cli_option,
+                             _detect_by_components, _detect_by_contours, detect_checks_on_page,
+                             determine_predominant_format, render_pdf_pages)
+
+_FINDERS = {"contours": _detect_by_contours, "components": _detect_by_components}
+
+
+def _best_time(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def benchmark_pdf(pdf_path, repeat, scale):
+    pages = [PageBuffer(p) for p in render_pdf_pages(pdf_path, dpi=RASTER_DPI)]
+    grays = [p.gray for p in pages]
+    fmt = determine_predominant_format(pages, scale=scale, method="contours")
+    label = {"A": "Contour/Bordered", "B": "Line-Grid"}.get(fmt, "unknown")
+    print(f"\n{pdf_path}: {len(pages)} pages at {RASTER_DPI} DPI, format {label}"
+          f"{'' if fmt == 'A' else '  (not Format A)'}")
+
+    boxes, totals = {}, {}
+    for method in DETECT_METHODS:
+        finder_s = page_s = 0.0
+        for gray in grays:
+            prep = PagePrep(gray, scale, method)
+            h, w = prep.shape
+            bw, ink_sat = prep.bw, prep.ink_sat
+            finder_s += _best_time(lambda: _FINDERS[method](bw, h, w, ink_sat), repeat)
+            # Arrays (not PageBuffers) get fresh preprocessing on every call
+            page_s += _best_time(lambda: detect_checks_on_page(gray, fmt, scale, method), repeat)
+        boxes[method] = [detect_checks_on_page(g, fmt, scale, method) for g in grays]
+        totals[method] = (finder_s, page_s)
+        print(f"  {method:<11} finder {len(pages) / max(finder_s, 1e-9):8.1f} pages/s   "
+              f"detection {len(pages) / max(page_s, 1e-9):6.1f} pages/s")
+
+    base, alt = DETECT_METHODS
+    same = sum(a == b for a, b in zip(boxes[base], boxes[alt]))
+    speedup = totals[base][1] / max(totals[alt][1], 1e-9)
+    print(f"  Same boxes on {same}/{len(pages)} pages; {alt} detection is {speedup:.2f}x {base}")
+    return same == len(pages)
+
+
+def main():
+    pdfs = [a for i, a in enumerate(sys.argv[1:], 1)
+            if not a.startswith("--") and not sys.argv[i - 1].startswith("--")]
+    if not pdfs:
+        print(__doc__)
+        return 2
+    repeat = max(1, int(_cli_option("--repeat", 3)))
+    scale = float(_cli_option("--scale", 1.0))
+    results = [benchmark_pdf(p, repeat, scale) for p in pdfs]
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Detection parity check: full resolution vs. DETECT_SCALE.
+
+Renders each PDF at RASTER_DPI, runs the detector at scale 1 and at the
+given scale, and matches boxes by IoU. Every full-resolution check must be
+found at the reduced scale (recall 100%) with no extra boxes; the largest
+edge offset is reported so crop margins can be judged.
+
+Usage:
+  python detect_parity.py <pdf> [<pdf> ...] [--scale 0.5] [--iou 0.9]
+Exit status is 1 if any page loses or gains a check.
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from box_ops import Boxes, intersection_areas
+from check_extractor import (RASTER_DPI, PageBuffer, _cli_option, detect_checks_on_page,
+                             determine_predominant_format, render_pdf_pages)
+
+
+def _match(full, scaled, min_iou):
+    """(matched count, extra scaled boxes, max edge offset px) for one page."""
+    if not full or not scaled:
+        return 0, len(scaled), 0
+    a, b = Boxes(full), Boxes(scaled)
+    inter = intersection_areas(a, b)
+    iou = inter / (a.areas[:, None] + b.areas[None, :] - inter)
+    best = iou.argmax(axis=1)
+    hit = iou[np.arange(len(full)), best] >= min_iou
+    offset = 0
+    if hit.any():
+        offset = int(np.abs(a.xyxy[hit] - b.xyxy[best[hit]]).max())
+    return int(hit.sum()), len(scaled) - len(set(best[hit].tolist())), offset
+
+
+def check_pdf(pdf_path, scale, min_iou):
+    pages = [PageBuffer(p) for p in render_pdf_pages(pdf_path, dpi=RASTER_DPI)]
+    fmt_full = determine_predominant_format(pages, scale=1.0)
+    fmt_scaled = determine_predominant_format(pages, scale=scale)
+    print(f"\n{pdf_path}: {len(pages)} pages, format {fmt_full} (full) / {fmt_scaled} (x{scale})")
+
+    ok = fmt_full == fmt_scaled
+    totals = {"full": 0, "matched": 0, "extra": 0, "t_full": 0.0, "t_scaled": 0.0}
+    worst_offset = 0
+    for idx, page in enumerate(pages):
+        t0 = time.time()
+        full = detect_checks_on_page(page, format_hint=fmt_full, scale=1.0)
+        t1 = time.time()
+        scaled = detect_checks_on_page(page, format_hint=fmt_full, scale=scale)
+        t2 = time.time()
+        matched, extra, offset = _match(full, scaled, min_iou)
+        totals["full"] += len(full)
+        totals["matched"] += matched
+        totals["extra"] += extra
+        totals["t_full"] += t1 - t0
+        totals["t_scaled"] += t2 - t1
+        worst_offset = max(worst_offset, offset)
+        if matched < len(full) or extra:
+            ok = False
+            print(f"  ✗ Page {idx+1}: {matched}/{len(full)} matched, {extra} extra")
+
+    recall = totals["matched"] / totals["full"] if totals["full"] else 1.0
+    print(f"  Recall {recall:.1%} ({totals['matched']}/{totals['full']}), {totals['extra']} extra, "
+          f"max edge offset {worst_offset}px")
+    print(f"  Detection time: {totals['t_full']:.2f}s full, {totals['t_scaled']:.2f}s at x{scale}")
+    return ok
+
+
+def main():
+    pdfs = [a for i, a in enumerate(sys.argv[1:], 1)
+            if not a.startswith("--") and not sys.argv[i - 1].startswith("--")]
+    if not pdfs:
+        print(__doc__)
+        return 2
+    scale = float(_cli_option("--scale", 0.5))
+    min_iou = float(_cli_option("--iou", 0.9))
+    results = [check_pdf(p, scale, min_iou) for p in pdfs]
+    print(f"\n{'✓ Parity' if all(results) else '✗ Parity FAILED'} at scale {scale} "
+          f"({sum(results)}/{len(results)} documents)")
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Layout fingerprint store for the check extractor.
+
+Statements from one bank repeat the same page template job after job. For
+each template seen, a small JSON record keeps the winning detection format
+and the line-grid layouts found on its pages, keyed by the page size and a
+hash of the page's ruling structure (the long-rule positions of its layout
+signature, quantized). A later job whose first pages match a record skips
+format voting and starts with those grids remembered; a miss runs full
+detection and writes the record. Pages whose rules straddle a quantization
+step get another key, so on a miss the records of the same page size are
+compared too (same_size()). Records are evicted least-recently-used once there
+are more than max_entries.
+
+Layout:
+  <store_dir>/<width>x<height>-<structure hash>.json
+"""
+
+import os
+import json
+import hashlib
+import threading
+import uuid
+from datetime import datetime
+
+
+class LayoutStore:
+    def __init__(self, store_dir, max_entries=500):
+        self.store_dir = str(store_dir)
+        self.max_entries = int(max_entries)
+        self._lock = threading.Lock()
+        os.makedirs(self.store_dir, exist_ok=True)
+
+    @staticmethod
+    def key(signature):
+        """Key for a layout signature ((h, w), row rules, column rules, tol).
+        Rule positions are bucketed by twice the tolerance, so small shifts
+        usually keep the key; a rule near a bucket edge can still move to the
+        next bucket (see same_size()). The page size must match exactly."""
+        (h, w), rows, cols, tol = signature
+        step = max(1, 2 * int(tol))
+        structure = json.dumps([[p // step for p in rows], [p // step for p in cols]])
+        return f"{int(w)}x{int(h)}-{hashlib.sha256(structure.encode()).hexdigest()[:16]}"
+
+    def _path(self, key):
+        return os.path.join(self.store_dir, f"{key}.json")
+
+    # ── Read ─────────────────────────────────────────────────────────
+    def get(self, key, touch=True):
+        """Stored record for a key, or None on a miss. touch=False leaves its
+        least-recently-used position alone."""
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path) as f:
+                record = json.load(f)
+        except Exception as e:
+            print(f"  Layout store: unreadable {path}: {e}")
+            return None
+        if touch:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        return record
+
+    def same_size(self, signature):
+        """Keys of the stored templates with the signature's page size, most
+        recently used first (candidates for a fuzzy match on a key miss)."""
+        (h, w), _, _, _ = signature
+        prefix = f"{int(w)}x{int(h)}-"
+        found = []
+        for name in os.listdir(self.store_dir):
+            if name.startswith(prefix) and name.endswith(".json"):
+                try:
+                    found.append((os.path.getmtime(os.path.join(self.store_dir, name)), name[:-5]))
+                except OSError:
+                    pass
+        return [key for _, key in sorted(found, reverse=True)]
+
+    # ── Write ────────────────────────────────────────────────────────
+    def put(self, key, record):
+        """Store a record (counting the jobs that produced it), then evict."""
+        path = self._path(key)
+        previous = self.get(key) or {}
+        record = dict(record, jobs=int(previous.get("jobs", 0)) + 1,
+                      updated=datetime.now().isoformat(timespec="seconds"))
+        tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(record, f)
+            os.replace(tmp, path)
+        except Exception as e:
+            print(f"  Layout store: write failed for {key}: {e}")
+            return
+        self.evict()
+
+    # ── Eviction ─────────────────────────────────────────────────────
+    def evict(self):
+        """Remove least-recently-used records beyond max_entries."""
+        with self._lock:
+            records = []
+            for name in os.listdir(self.store_dir):
+                if name.endswith(".json"):
+                    try:
+                        records.append((os.path.getmtime(os.path.join(self.store_dir, name)), name))
+                    except OSError:
+                        pass
+            records.sort()
+            for _, name in records[:max(0, len(records) - self.max_entries)]:
+                try:
+                    os.remove(os.path.join(self.store_dir, name))
+                except OSError:
+                    pass
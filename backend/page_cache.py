@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Rendered-page cache for the check extractor.
+
+Rasterized PDF pages are stored on disk as raw .npy arrays keyed by the PDF's
+content hash, the render DPI and the colour mode. Re-extraction, re-detection
+and page previews memory-map them instead of running Poppler again.
+Pages are written by one background thread, off the render/detect path;
+a page that would push the queue past max_pending_bytes is dropped (it is
+rendered again on the next miss) rather than waited for. Whole entries are
+evicted least-recently-used once the cache grows past max_bytes; a
+document estimated larger than max_bytes on its own is not cached.
+
+Layout:
+  <cache_dir>/<sha256>-<dpi>-<rgb|gray>/page_0001.npy
+"""
+
+import os
+import shutil
+import hashlib
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Content hash of a file, read in chunks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class PageCache:
+    def __init__(self, cache_dir, max_bytes=2 * 1024 ** 3, max_pending_bytes=256 * 1024 ** 2):
+        self.cache_dir = str(cache_dir)
+        self.max_bytes = int(max_bytes)
+        self.max_pending_bytes = int(max_pending_bytes)
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="page-cache")
+        self._queued = 0
+        self._queue_lock = threading.Lock()
+        self._oversized = set()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(content_hash, dpi, grayscale=False):
+        return f"{content_hash}-{int(dpi)}-{'gray' if grayscale else 'rgb'}"
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _page_path(self, key, page_idx):
+        return os.path.join(self._entry_dir(key), f"page_{page_idx + 1:04d}.npy")
+
+    def _touch(self, key):
+        try:
+            os.utime(self._entry_dir(key))
+        except OSError:
+            pass
+
+    # ── Read ─────────────────────────────────────────────────────────
+    def load_array(self, key, page_idx):
+        """Memory-mapped array for a 0-based page, or None on a miss."""
+        path = self._page_path(key, page_idx)
+        if not os.path.exists(path):
+            return None
+        try:
+            arr = np.load(path, mmap_mode="r")
+        except Exception as e:
+            print(f"  Page cache: unreadable {path}: {e}")
+            return None
+        self._touch(key)
+        return arr
+
+    def get_pages(self, key, first_page, last_page):
+        """Memory-mapped page arrays for an inclusive 1-based range, or None
+        unless all are cached."""
+        paths = [self._page_path(key, p - 1) for p in range(first_page, last_page + 1)]
+        if not all(os.path.exists(p) for p in paths):
+            return None
+        pages = []
+        for page_idx in range(first_page - 1, last_page):
+            arr = self.load_array(key, page_idx)
+            if arr is None:
+                return None
+            pages.append(arr)
+        return pages
+
+    # ── Write ────────────────────────────────────────────────────────
+    def put_pages(self, key, first_page, pages, total_pages=None):
+        """Queue rendered page arrays starting at 1-based first_page for the
+        background writer, which evicts afterwards. Never blocks: pages that
+        do not fit the queue are dropped, and a document whose estimated size
+        (average page size x total_pages) exceeds max_bytes is not cached."""
+        pages = [np.asarray(p) for p in pages]
+        if not pages or key in self._oversized:
+            return
+        page_bytes = sum(p.nbytes for p in pages) / len(pages)
+        if page_bytes * max(total_pages or 0, first_page - 1 + len(pages)) > self.max_bytes:
+            self._oversized.add(key)
+            print(f"  Page cache: {key[:12]}… exceeds {self.max_bytes // (1024 * 1024)} MB, not cached")
+            return
+        dropped = 0
+        for page_idx, page in enumerate(pages, first_page - 1):
+            with self._queue_lock:
+                if self._queued and self._queued + page.nbytes > self.max_pending_bytes:
+                    dropped += 1
+                    continue
+                self._queued += page.nbytes
+            self._writer.submit(self._write_page, key, page_idx, page)
+        if dropped:
+            print(f"  Page cache: write queue full, {dropped} page(s) not cached")
+        self._writer.submit(self.evict)
+
+    def flush(self):
+        """Wait until every queued page is written."""
+        self._writer.submit(lambda: None).result()
+
+    def _write_page(self, key, page_idx, page):
+        try:
+            if key in self._oversized:
+                return
+            path = self._page_path(key, page_idx)
+            if os.path.exists(path):
+                return
+            entry = self._entry_dir(key)
+            os.makedirs(entry, exist_ok=True)
+            if self._entry_size(entry) + page.nbytes > self.max_bytes:
+                # Pages larger than estimated: drop the entry rather than pin it over the limit
+                self._oversized.add(key)
+                shutil.rmtree(entry, ignore_errors=True)
+                print(f"  Page cache: {key[:12]}… exceeds {self.max_bytes // (1024 * 1024)} MB, not cached")
+                return
+            tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, page)
+            os.replace(tmp, path)
+            self._touch(key)
+        except Exception as e:
+            print(f"  Page cache: write failed for {key}: {e}")
+        finally:
+            with self._queue_lock:
+                self._queued -= page.nbytes
+
+    # ── Eviction ─────────────────────────────────────────────────────
+    @staticmethod
+    def _entry_size(entry):
+        size = 0
+        for name in os.listdir(entry):
+            try:
+                size += os.path.getsize(os.path.join(entry, name))
+            except OSError:
+                pass
+        return size
+
+    def _entries(self):
+        """(last_used, size_bytes, key) for every cache entry."""
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry = self._entry_dir(key)
+            if not os.path.isdir(entry):
+                continue
+            entries.append((os.path.getmtime(entry), self._entry_size(entry), key))
+        return entries
+
+    def evict(self):
+        """Remove least-recently-used entries until the cache fits max_bytes."""
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            # Oldest first; every entry fits max_bytes on its own (see _write_page)
+            for _, size, key in entries:
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+                total -= size
+                print(f"  Page cache: evicted {key[:12]}… ({size // (1024 * 1024)} MB)")
@@ -0,0 +1,9 @@
+-- Migration 024: Persist the pre-OCR gate counts on check_jobs
+--
+-- The API reports how many crops the pre-OCR gate kept out of OCR (skipped_crops)
+-- and why (skipped_by_step, e.g. {"shape": 2, "blanks": 1}). They were only kept
+-- in memory, so a completed job read back from the DB lost them.
+
+ALTER TABLE public.check_jobs
+  ADD COLUMN IF NOT EXISTS skipped_crops   INTEGER DEFAULT 0,
+  ADD COLUMN IF NOT EXISTS skipped_by_step JSONB   DEFAULT '{}'::jsonb;